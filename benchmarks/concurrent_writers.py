@@ -0,0 +1,123 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Times concurrent writers on one database.
+
+Starts many CLI processes at once against a synthetic league, each adding
+matches (and the odd player) in a loop, the way several scorekeepers share
+one league.db, and reports throughput and command latency:
+
+    python benchmarks/concurrent_writers.py --processes 8 --commands 25
+
+tests/test_concurrency.py checks that no write is lost.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+MAIN = os.path.join(ROOT, "src", "main.py")
+
+
+def cli(db_path, *argv):
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, MAIN, "--db-path", db_path, *argv],
+        capture_output=True,
+        text=True,
+    )
+    return time.perf_counter() - start
+
+
+def writer(db_path, worker, commands, names, last_day, seed):
+    """Runs one scorekeeper's commands; returns their latencies."""
+    rng = random.Random(seed + worker)
+    latencies = []
+    for i in range(commands):
+        if i % 10 == 9:
+            argv = ["players", "add", f"W{worker:02}-{i:04}"]
+        else:
+            # Within the last week, so every add replays a little history
+            day = last_day - timedelta(days=rng.randrange(7))
+            when = f"{day}T{rng.randrange(10, 22):02}:{rng.randrange(60):02}"
+            argv = ["matches", "add", ",".join(rng.sample(names, 2)), "--time", when]
+        latencies.append(cli(db_path, *argv))
+    return latencies
+
+
+def counts(db_path):
+    conn = sqlite3.connect(db_path)
+    players, matches, last = conn.execute(
+        "SELECT (SELECT count(*) FROM players), (SELECT count(*) FROM matches), "
+        "(SELECT max(datetime) FROM matches)"
+    ).fetchone()
+    conn.close()
+    return players, matches, last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--commands", type=int, default=25, help="Per process")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--history", type=int, default=5000, help="Initial matches")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(ROOT, "schemas.sql"), workdir)
+        os.chdir(workdir)
+        db_path = os.path.join(workdir, "league.db")
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(HERE, "generate_league.py"),
+                db_path,
+                "--matches",
+                str(args.history),
+                "--players",
+                str(args.players),
+            ],
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        players_before, matches_before, last = counts(db_path)
+        last_day = date.fromisoformat(last.split("T")[0])
+        names = [f"P{i + 1:06d}" for i in range(args.players)]
+
+        print(
+            f"{args.processes} processes x {args.commands} commands on "
+            f"{matches_before} matches, {players_before} players"
+        )
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.processes) as pool:
+            results = list(
+                pool.map(
+                    lambda worker: writer(
+                        db_path, worker, args.commands, names, last_day, args.seed
+                    ),
+                    range(args.processes),
+                )
+            )
+        elapsed = time.perf_counter() - start
+
+        latencies = [seconds for worker in results for seconds in worker]
+        print(
+            f"  {len(latencies)} commands in {elapsed:.1f}s "
+            f"({len(latencies) / elapsed:.1f}/s), "
+            f"latency median {statistics.median(latencies):.2f}s, "
+            f"max {max(latencies):.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
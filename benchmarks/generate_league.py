@@ -0,0 +1,190 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Generates a deterministic synthetic league for benchmarks.
+
+Players are split into pools that mostly play among themselves, the way
+real leagues split into clubs or skill brackets. Matches are a mix of
+1v1, team and free-for-all games spread over a date range, and each
+player has a hidden skill that decides results. The same arguments and
+seed always produce the same league.
+
+The output format follows the file name: .json and .ndjson files can be
+loaded with `trueskill-cli import`, and a .db file is imported directly.
+
+    python benchmarks/generate_league.py league.ndjson --matches 100000
+    python benchmarks/generate_league.py league.db --players 2000 --days 730
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+
+def iter_league(
+    players=400,
+    matches=10000,
+    start="2024-01-01",
+    days=365,
+    mix=(0.6, 0.3, 0.1),
+    team_size=2,
+    ffa_size=(3, 6),
+    pools=8,
+    crossover=0.05,
+    seed=1,
+):
+    """Yields player, team and match records in the NDJSON export layout.
+
+    mix gives the share of 1v1, team and free-for-all matches. A match
+    draws everyone from one pool, except a crossover share that mixes pools.
+    Teams are shared between matches by lineup, as the CLI stores them.
+    """
+    rng = random.Random(seed)
+    skills = [rng.gauss(25.0, 8.0) for _ in range(players)]
+    for i in range(players):
+        yield {
+            "type": "player",
+            "id": i + 1,
+            "name": f"P{i + 1:06d}",
+            "mu": 25.0,
+            "sigma": 8.333,
+        }
+
+    pools = max(1, min(pools, players // max(2 * team_size, ffa_size[1])))
+    pool_size = players // pools
+    first_day = date.fromisoformat(start)
+    teams = {}
+    one_v_one, team_share, _ = mix
+    total = sum(mix)
+
+    # Matches come out in time order, spread evenly with random minutes
+    for match_id in range(1, matches + 1):
+        day = first_day + timedelta(days=(match_id - 1) * days // matches)
+        minute = rng.randrange(10 * 60, 22 * 60)
+        when = f"{day.isoformat()}T{minute // 60:02}:{minute % 60:02}"
+
+        if rng.random() < crossover:
+            pool = range(players)
+        else:
+            p = rng.randrange(pools)
+            pool = range(p * pool_size, (p + 1) * pool_size)
+
+        kind = rng.random() * total
+        if kind < one_v_one:
+            sides = [[i] for i in rng.sample(pool, 2)]
+        elif kind < one_v_one + team_share:
+            picked = rng.sample(pool, 2 * team_size)
+            sides = [picked[:team_size], picked[team_size:]]
+        else:
+            sides = [[i] for i in rng.sample(pool, rng.randint(*ffa_size))]
+
+        # Noisy skill decides the finishing order
+        performance = [
+            sum(skills[i] for i in side) / len(side) + rng.gauss(0, 4.0)
+            for side in sides
+        ]
+        order = sorted(range(len(sides)), key=lambda s: -performance[s])
+
+        match_teams = []
+        for place, side_index in enumerate(order, start=1):
+            lineup = tuple(sorted(i + 1 for i in sides[side_index]))
+            team_id = teams.get(lineup)
+            if team_id is None:
+                team_id = teams[lineup] = len(teams) + 1
+                yield {"type": "team", "id": team_id, "players": list(lineup)}
+            match_teams.append({"team_id": team_id, "place": place, "score": None})
+        yield {
+            "type": "match",
+            "id": match_id,
+            "datetime": when,
+            "match_teams": match_teams,
+        }
+
+
+def write_league(path, workers=None, **options):
+    """Writes a league to .json, .ndjson or (through import) .db."""
+    if path.endswith(".db"):
+        return _write_db(path, workers, **options)
+
+    records = iter_league(**options)
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            f.write(json.dumps({"type": "header"}) + "\n")
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+            return
+
+        data = {"players": [], "teams": [], "matches": []}
+        for record in records:
+            data[record.pop("type") + "s"].append(record)
+        json.dump(data, f)
+
+
+def _write_db(path, workers, **options):
+    sys.path.insert(0, SRC)
+    from contextlib import redirect_stdout
+
+    from db import storage
+    from db.serialization import import_db
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "league.ndjson")
+        write_league(source, **options)
+        if os.path.exists(path):
+            os.remove(path)
+        storage.set_db_path(path)
+        storage.init_db()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            import_db(source, workers)
+
+
+def parse_mix(text):
+    """Parses "1v1=0.6,team=0.3,ffa=0.1" into a (1v1, team, ffa) tuple."""
+    shares = dict(part.split("=") for part in text.split(","))
+    return tuple(float(shares.get(kind, 0)) for kind in ("1v1", "team", "ffa"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="Output file (.json, .ndjson or .db)")
+    parser.add_argument("--players", type=int, default=400)
+    parser.add_argument("--matches", type=int, default=10000)
+    parser.add_argument("--start", default="2024-01-01", help="First match date")
+    parser.add_argument("--days", type=int, default=365, help="Date spread")
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=(0.6, 0.3, 0.1),
+        help="Match shares, e.g. 1v1=0.6,team=0.3,ffa=0.1",
+    )
+    parser.add_argument("--team-size", type=int, default=2)
+    parser.add_argument("--pools", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, help="Replay workers for .db output")
+    args = parser.parse_args()
+
+    if args.path.endswith(".db"):
+        # schemas.sql is looked up in the working directory
+        args.path = os.path.abspath(args.path)
+        os.chdir(os.path.join(SRC, ".."))
+    write_league(
+        args.path,
+        workers=args.workers,
+        players=args.players,
+        matches=args.matches,
+        start=args.start,
+        days=args.days,
+        mix=args.mix,
+        team_size=args.team_size,
+        pools=args.pools,
+        seed=args.seed,
+    )
+    print(f"Wrote {args.matches} matches for {args.players} players to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
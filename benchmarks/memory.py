@@ -0,0 +1,120 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Measures the memory the loaded league state takes.
+
+For each league size, loads a synthetic league (see generate_league.py)
+in a fresh process and reports the resident memory load_db() adds, per
+100k matches, along with the load time. Point --src at another checkout's
+src directory to compare two versions on the same databases:
+
+    python benchmarks/memory.py --sizes 100000,300000
+    python benchmarks/memory.py --sizes 100000,300000 --src /tmp/old/src
+"""
+
+import argparse
+import gc
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+SRC = os.path.join(ROOT, "src")
+
+
+def rss_mb():
+    """Current resident set size, or the peak where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(src, db_path):
+    """Loads the league and prints a JSON line with its memory and load time."""
+    sys.path.insert(0, src)
+    from db import storage
+
+    storage.set_db_path(db_path)
+    storage.init_db()
+    gc.collect()
+    before = rss_mb()
+    start = time.perf_counter()
+    storage.load_db()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    print(json.dumps({"mb": rss_mb() - before, "seconds": seconds}))
+
+
+def measure(src, db_path):
+    result = subprocess.run(
+        [sys.executable, __file__, "--child", "--src", src, "--db", db_path],
+        cwd=os.path.dirname(db_path),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="100000,300000",
+        help="Comma-separated match counts (default: 100000,300000)",
+    )
+    parser.add_argument(
+        "--matches-per-player",
+        type=int,
+        default=25,
+        help="Sets the roster size for each league size (default: 25)",
+    )
+    parser.add_argument("--src", default=SRC, help="src directory to measure")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(os.path.abspath(args.src), args.db)
+        return
+
+    src = os.path.abspath(args.src)
+    print(f"Measuring {src}")
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(ROOT, "schemas.sql"), workdir)
+        for size in (int(s) for s in args.sizes.split(",")):
+            players = max(50, size // args.matches_per_player)
+            db_path = os.path.join(workdir, f"league-{size}.db")
+            subprocess.run(
+                [
+                    sys.executable,
+                    os.path.join(HERE, "generate_league.py"),
+                    db_path,
+                    "--matches",
+                    str(size),
+                    "--players",
+                    str(players),
+                ],
+                check=True,
+                stdout=subprocess.DEVNULL,
+            )
+            result = measure(src, db_path)
+            print(
+                f"  {size:>8} matches: {result['mb']:8.1f} MB "
+                f"({result['mb'] * 100000 / size:6.1f} MB per 100k matches), "
+                f"loaded in {result['seconds']:.2f}s"
+            )
+
+
+if __name__ == "__main__":
+    main()
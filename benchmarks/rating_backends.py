@@ -0,0 +1,81 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Compares the rating backends in ratings.py for speed and agreement.
+
+Replays the same random sequence of 1v1, 2v2 and free-for-all matches under
+each backend and reports matches per second plus the largest difference in
+mu and sigma between the fast path and the reference trueskill package.
+
+    python benchmarks/rating_backends.py --matches 20000 --players 200
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from models import Player  # noqa: E402
+import ratings  # noqa: E402
+
+TOLERANCE = 1e-6
+
+
+def generate_matches(num_matches, num_players, seed):
+    rng = random.Random(seed)
+    matches = []
+    for _ in range(num_matches):
+        kind = rng.random()
+        if kind < 0.6:
+            ids = rng.sample(range(num_players), 2)
+            matches.append([[ids[0]], [ids[1]]])
+        elif kind < 0.9:
+            ids = rng.sample(range(num_players), 4)
+            matches.append([ids[:2], ids[2:]])
+        else:
+            ids = rng.sample(range(num_players), rng.randint(3, 6))
+            matches.append([[i] for i in ids])
+    return matches
+
+
+def replay(backend, matches, num_players, two_team_only):
+    ratings.set_backend(backend)
+    players = [Player(i, f"p{i}", 25.0, 25.0 / 3) for i in range(num_players)]
+    start = time.perf_counter()
+    count = 0
+    for teams in matches:
+        if two_team_only and len(teams) != 2:
+            continue
+        groups = [[players[i] for i in team] for team in teams]
+        if len(groups) > 2:
+            ratings.update_ratings(*groups, ranks=list(range(1, len(groups) + 1)))
+        else:
+            ratings.update_ratings(*groups)
+        count += 1
+    elapsed = time.perf_counter() - start
+    return players, count / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--matches", type=int, default=20000)
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    matches = generate_matches(args.matches, args.players, args.seed)
+    for label, two_team_only in (("1v1/two-team only", True), ("mixed", False)):
+        ref, ref_rate = replay("trueskill", matches, args.players, two_team_only)
+        fast, fast_rate = replay("fast", matches, args.players, two_team_only)
+        max_mu = max(abs(a.mu - b.mu) for a, b in zip(ref, fast))
+        max_sigma = max(abs(a.sigma - b.sigma) for a, b in zip(ref, fast))
+        status = "ok" if max(max_mu, max_sigma) <= TOLERANCE else "OUT OF TOLERANCE"
+        print(f"{label}:")
+        print(f"  trueskill: {ref_rate:10.0f} matches/s")
+        print(f"  fast:      {fast_rate:10.0f} matches/s ({fast_rate / ref_rate:.1f}x)")
+        print(f"  max |Δμ|={max_mu:.2e}, max |Δσ|={max_sigma:.2e} ({status})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Measures CLI cold-start time per command.
+
+Runs each command repeatedly in fresh processes against a small seeded
+league and reports the median wall-clock time, for the source tree and
+optionally a PyInstaller binary (e.g. dist/trueskill-cli from bundle.sh).
+--importtime prints the slowest imports for one command, as reported by
+`python -X importtime`.
+
+    python benchmarks/startup.py --runs 20 --binary dist/trueskill-cli
+    python benchmarks/startup.py --importtime "players list"
+"""
+
+import argparse
+import os
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+MAIN = os.path.join(ROOT, "src", "main.py")
+
+COMMANDS = [
+    "--version",
+    "players list",
+    "rankings",
+    "rankings --date 2025-01-02",
+    "matches list",
+]
+
+SEED = [
+    "players add Alice,Bob,Carol,Dave",
+    "matches add Alice,Bob --time 2025-01-01T10:00",
+    "matches add [Alice,Carol],[Bob,Dave] --time 2025-01-02T10:00",
+]
+
+
+def seed_league(workdir):
+    shutil.copy(os.path.join(ROOT, "schemas.sql"), workdir)
+    for command in SEED:
+        subprocess.run(
+            [sys.executable, MAIN, *shlex.split(command)],
+            cwd=workdir,
+            check=True,
+            capture_output=True,
+        )
+
+
+def time_command(prefix, command, workdir, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [*prefix, *shlex.split(command)], cwd=workdir, capture_output=True
+        )
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def import_breakdown(command, workdir, top):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", MAIN, *shlex.split(command)],
+        cwd=workdir,
+        capture_output=True,
+        text=True,
+    )
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_part, cumulative, name = line[len("import time:") :].split("|")
+        rows.append((int(cumulative), int(self_part), name.rstrip()))
+
+    # Top-level imports are the ones indented by a single space
+    total = sum(row[0] for row in rows if not row[2].startswith("  "))
+    print(f"Imports for '{command}': {total / 1000:.1f} ms total")
+    for cumulative, own, name in sorted(rows, reverse=True)[:top]:
+        print(
+            f"  {cumulative / 1000:8.1f} ms  (self {own / 1000:6.1f})  {name.strip()}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--binary", help="PyInstaller build to time as well")
+    parser.add_argument("--importtime", metavar="COMMAND")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_league(workdir)
+
+        if args.importtime:
+            import_breakdown(args.importtime, workdir, args.top)
+            return
+
+        targets = [("source", [sys.executable, MAIN])]
+        if args.binary:
+            targets.append(("binary", [os.path.abspath(args.binary)]))
+
+        print(f"{'command':30}" + "".join(f"{label:>12}" for label, _ in targets))
+        for command in COMMANDS:
+            timings = [
+                time_command(prefix, command, workdir, args.runs)
+                for _, prefix in targets
+            ]
+            print(f"{command:30}" + "".join(f"{ms:10.1f}ms" for ms in timings))
+
+
+if __name__ == "__main__":
+    main()
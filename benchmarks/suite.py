@@ -0,0 +1,338 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""End-to-end benchmarks for the storage, replay and command paths.
+
+For each league size, generates a synthetic league (see generate_league.py)
+and times every operation in a fresh process against a fresh copy of the
+database. Results record wall time and peak RSS per operation, and are
+written as JSON so two versions can be compared:
+
+    python benchmarks/suite.py --sizes 1000,10000 --output before.json
+    python benchmarks/suite.py --sizes 1000,10000 --compare before.json
+
+Sizes up to 1M matches work, but generating and replaying one takes a while.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+SRC = os.path.join(ROOT, "src")
+
+# Slowdowns past this ratio are flagged by --compare
+REGRESSION_RATIO = 1.10
+
+
+def _mid_match():
+    from db.storage import DBState
+
+    ordered = sorted(DBState.matches, key=lambda m: m.datetime)
+    return ordered[len(ordered) // 2]
+
+
+def _mid_date():
+    return _mid_match().datetime.split("T")[0]
+
+
+# Each operation runs its untimed setup and returns the part to time.
+
+
+def op_load_db():
+    from db.storage import load_db
+
+    return load_db
+
+
+def op_save_db():
+    from db.storage import DBState, load_db, save_db
+
+    load_db()
+
+    def run():
+        # Forces the full rewrite an import does
+        DBState.rows = None
+        save_db("benchmark")
+
+    return run
+
+
+def op_add_match():
+    from db.storage import DBState, load_db
+    from cli.matches import add_match
+
+    load_db()
+    names = ",".join(p.name for p in DBState.players[:2])
+    when = f"{_mid_date()}T12:00"
+    return lambda: add_match(names, when)
+
+
+def op_edit_match():
+    import builtins
+    import prompt_toolkit
+    from db.storage import load_db
+    from cli.matches import edit_match
+
+    load_db()
+    match = _mid_match()
+    # The same lineups in reverse order, moved to the next hour
+    lineup = ",".join(
+        "[" + ",".join(p.name for p in mt.team.players) + "]"
+        for mt in reversed(match.match_teams)
+    )
+    hour = int(match.datetime[11:13])
+    when = f"{match.datetime[:11]}{(hour + 1) % 24:02}{match.datetime[13:]}"
+    prompt_toolkit.prompt = lambda *args, **kwargs: lineup
+    builtins.input = lambda *args: when
+    return lambda: edit_match(str(match.id))
+
+
+def op_delete_match():
+    from db.storage import load_db
+    from cli.matches import delete_match
+
+    load_db()
+    match_id = str(_mid_match().id)
+    return lambda: delete_match(match_id)
+
+
+def op_regenerate_all():
+    from db.storage import load_db
+    from db.player_days import regenerate_player_days_from
+
+    load_db()
+    return lambda: regenerate_player_days_from(None)
+
+
+def op_regenerate_from_mid():
+    from db.storage import load_db
+    from db.player_days import regenerate_player_days_from
+
+    load_db()
+    date_str = _mid_date()
+    return lambda: regenerate_player_days_from(date_str)
+
+
+def op_show_rankings_for_date():
+    from db.storage import load_db
+    from cli.rankings import show_rankings_for_date
+
+    load_db()
+    date_str = _mid_date()
+    return lambda: show_rankings_for_date(date_str)
+
+
+def op_show_rankings_top10():
+    from cli.rankings import show_rankings
+
+    return lambda: show_rankings(top=10)
+
+
+def op_export_json():
+    from db.serialization import export_db
+
+    return lambda: export_db("league.json")
+
+
+def op_export_ndjson():
+    from db.serialization import export_db
+
+    return lambda: export_db("league.ndjson")
+
+
+def op_import_json():
+    from db.serialization import export_db, import_db
+
+    export_db("league.json")
+    return lambda: import_db("league.json")
+
+
+def op_import_ndjson():
+    from db.serialization import export_db, import_db
+
+    export_db("league.ndjson")
+    return lambda: import_db("league.ndjson")
+
+
+OPERATIONS = {
+    name[len("op_") :]: function
+    for name, function in globals().items()
+    if name.startswith("op_")
+}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(operation, db_path):
+    """Times one operation in this process and prints a JSON result line."""
+    sys.path.insert(0, SRC)
+    from db import storage
+
+    storage.set_db_path(db_path)
+    storage.init_db()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        run = OPERATIONS[operation]()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb()}))
+
+
+def generate(path, size, players):
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(HERE, "generate_league.py"),
+            path,
+            "--matches",
+            str(size),
+            "--players",
+            str(players),
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def measure(operation, base_db, workdir, repeat):
+    samples = []
+    for _ in range(repeat):
+        db_path = os.path.join(workdir, "league.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        shutil.copy(base_db, db_path)
+        result = subprocess.run(
+            [sys.executable, __file__, "--child", operation, "--db", db_path],
+            cwd=workdir,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise RuntimeError(f"{operation} failed:\n{result.stderr}")
+        samples.append(json.loads(result.stdout.splitlines()[-1]))
+    return {
+        "seconds": statistics.median(s["seconds"] for s in samples),
+        "peak_rss_mb": max((s["peak_rss_mb"] or 0) for s in samples) or None,
+    }
+
+
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {(r["size"], r["operation"]): r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision')}):")
+    for r in results:
+        old = before.get((r["size"], r["operation"]))
+        if old is None:
+            continue
+        ratio = r["seconds"] / old["seconds"] if old["seconds"] else float("inf")
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+        print(
+            f"{r['size']:>8} {r['operation']:24} "
+            f"{old['seconds']:9.3f}s -> {r['seconds']:9.3f}s  x{ratio:.2f}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default="1000,10000,100000",
+        help="Comma-separated match counts (default: 1000,10000,100000)",
+    )
+    parser.add_argument(
+        "--matches-per-player",
+        type=int,
+        default=25,
+        help="Sets the roster size for each league size (default: 25)",
+    )
+    parser.add_argument(
+        "--operations",
+        default=",".join(OPERATIONS),
+        help="Comma-separated subset of: " + ", ".join(OPERATIONS),
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per operation")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", metavar="RESULTS", help="Earlier results file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--db", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.db)
+        return
+
+    operations = args.operations.split(",")
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(ROOT, "schemas.sql"), workdir)
+        for size in (int(s) for s in args.sizes.split(",")):
+            players = max(50, size // args.matches_per_player)
+            base_db = os.path.join(workdir, f"base-{size}.db")
+            start = time.perf_counter()
+            generate(base_db, size, players)
+            print(
+                f"{size} matches, {players} players "
+                f"(generated in {time.perf_counter() - start:.1f}s)"
+            )
+            for operation in operations:
+                result = measure(operation, base_db, workdir, args.repeat)
+                rss = result["peak_rss_mb"]
+                print(
+                    f"  {operation:24} {result['seconds']:9.3f}s"
+                    + (f"  {rss:8.1f} MB" if rss is not None else "")
+                )
+                results.append(
+                    {"size": size, "players": players, "operation": operation, **result}
+                )
+
+    report = {
+        "revision": git_revision(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
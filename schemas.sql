@@ -36,4 +36,4 @@ create table match_teams (
   team_id integer not null references teams(id) on delete cascade,
   place integer check (place > 0), -- may be null
   score integer check (score >= 0) -- may be null
-);
\ No newline at end of file
+);
@@ -0,0 +1,105 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import argparse
+import shlex
+import sys
+
+from db.storage import save_db, write_lock
+from db.player_days import regenerate_player_days_from
+from cli.matches import create_match, remove_match
+from cli.players import create_players, remove_player
+
+
+class BatchError(Exception):
+    """A batch line failed, so the whole batch is thrown away."""
+
+
+class _LineParser(argparse.ArgumentParser):
+    def error(self, message):
+        raise ValueError(message)
+
+
+def _line_parser():
+    parser = _LineParser(prog="batch", add_help=False)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    players_parser = sub.add_parser("players", add_help=False)
+    players_parser.add_argument("action", choices=["add", "delete"])
+    players_parser.add_argument("name")
+
+    matches_parser = sub.add_parser("matches", add_help=False)
+    matches_parser.add_argument("action", choices=["add", "delete"])
+    matches_parser.add_argument("arg")
+    matches_parser.add_argument("--time")
+    matches_parser.add_argument("--scores")
+    return parser
+
+
+def run_command(parser, tokens):
+    """Applies one batch line to the state; returns the match date it touches."""
+    args = parser.parse_args(tokens)
+
+    if args.cmd == "players":
+        if args.action == "add":
+            create_players(args.name)
+        elif not remove_player(args.name):
+            raise ValueError(f"Player '{args.name}' not found.")
+        return None
+
+    if args.action == "add":
+        match = create_match(args.arg, args.time, args.scores)
+        print(f"Match recorded at {match.datetime}")
+    else:
+        try:
+            match = remove_match(args.arg)
+        except (ValueError, KeyError):
+            raise ValueError(f"No match found with ID {args.arg}")
+        print(f"Match {match.id} deleted.")
+    return match.date
+
+
+def run_batch(path="-"):
+    """Runs CLI-style commands from a file (or stdin for "-") as one operation.
+
+    Lines look like the normal command line without the program name, e.g.
+    `matches add [A,B],[C,D] --time 2025-05-01T15:00 --scores 21,17`. Ratings
+    are replayed once from the earliest affected date and everything is
+    committed in a single transaction. If any line fails, nothing is saved.
+    """
+    parser = _line_parser()
+    earliest = None
+    failed = 0
+
+    source = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    with source:
+        for lineno, line in enumerate(source, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                tokens = shlex.split(line)
+                if tokens and tokens[0] in ("trueskill-cli", "trueskill-cli.exe"):
+                    tokens = tokens[1:]
+                match_date = run_command(parser, tokens)
+            except Exception as e:
+                print(f"Line {lineno}: {e}")
+                failed += 1
+                continue
+            if match_date and (earliest is None or match_date < earliest):
+                earliest = match_date
+
+    try:
+        with write_lock() as conn:
+            # The lines that worked already changed the in-memory state.
+            # Raising rolls the lock back and marks that state stale (its
+            # revision is cleared), so a daemon reloads before the next
+            # command instead of saving the discarded lines with it.
+            if failed:
+                raise BatchError(f"{failed} line(s) failed; nothing was saved.")
+            if earliest is not None:
+                regenerate_player_days_from(earliest, conn=conn)
+            save_db(f"batch {path}", conn=conn)
+    except BatchError as e:
+        print(e)
+        return
+    print("Batch saved.")
@@ -0,0 +1,68 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Kept free of heavy imports: every invocation checks for a daemon first.
+
+import json
+import os
+import socket
+import sys
+
+# Commands a running daemon answers for the CLI. Interactive ones
+# (matches edit) and whole-database ones (import, rebuild-snapshots) always
+# run in the calling process; the daemon notices their writes and reloads.
+FORWARDED = {
+    "players",
+    "rankings",
+    "matches",
+    "matchmake",
+    "export",
+    "undo",
+    "redo",
+    "batch",
+}
+
+
+def socket_path(db_path):
+    return os.path.abspath(db_path) + ".sock"
+
+
+def _forwardable(args):
+    if args.cmd not in FORWARDED:
+        return False
+    if args.cmd == "matches" and args.action == "edit":
+        return False
+    if args.cmd == "batch" and args.path == "-":
+        return False
+    return True
+
+
+def forward(args):
+    """Sends a command to the daemon serving this database, if one is running.
+
+    Returns False when there is no daemon (or the command must run locally),
+    in which case the caller runs the command itself.
+    """
+    if not hasattr(socket, "AF_UNIX") or not _forwardable(args):
+        return False
+    path = socket_path(args.db_path)
+    if not os.path.exists(path):
+        return False
+
+    request = dict(vars(args))
+    request["argv"] = sys.argv[1:]
+    # The daemon has its own working directory
+    if args.cmd in ("export", "batch"):
+        request["path"] = os.path.abspath(args.path)
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            sock.shutdown(socket.SHUT_WR)
+            with sock.makefile("r", encoding="utf-8") as response:
+                for line in response:
+                    print(line, end="")
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Stale socket left by a daemon that is no longer running
+        return False
+    return True
@@ -0,0 +1,111 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import argparse
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+
+from contextlib import redirect_stdout
+from db import journal, storage
+from cli import util
+from cli.client import socket_path
+import columnar
+import profiling
+import ratings
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from cli.dispatch import run_cli
+
+        line = self.rfile.readline()
+        if not line.strip():
+            # Liveness probe from another serve
+            return
+        request = json.loads(line)
+        label = " ".join(request.pop("argv"))
+        args = argparse.Namespace(**request)
+        out = io.StringIO()
+        profiling.reset()
+        with redirect_stdout(out):
+            try:
+                with profiling.span("refresh"):
+                    self.server.refresh()
+                ratings.set_backend(args.rating_backend)
+                journal.set_depth(args.undo_depth)
+                storage.set_backup_interval(args.backup_interval)
+                util.set_command_label(label)
+                run_cli(args, loaded=True)
+            except Exception as e:
+                print(f"Error: {e}")
+            self.server.mark_seen()
+        self.wfile.write(out.getvalue().encode("utf-8"))
+        # Profiled with TRUESKILL_PROFILE, reported on the daemon's stderr
+        profiling.report(label)
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    """Serves CLI commands from one resident copy of the state.
+
+    Requests are handled one at a time, so every write goes through this
+    single process in order.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, _Handler)
+        # Kept open to notice commits made by other processes
+        self.conn = storage.connect()
+        self.data_version = None
+
+    def _current_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        # A failed write leaves no revision, since the state may have changed
+        if (
+            self._current_version() != self.data_version
+            or storage.DBState.revision is None
+        ):
+            storage.load_db()
+
+    def mark_seen(self):
+        self.data_version = self._current_version()
+
+    def server_close(self):
+        super().server_close()
+        self.conn.close()
+
+
+def serve():
+    if not hasattr(socket, "AF_UNIX"):
+        print("serve needs Unix domain sockets, which this platform lacks.")
+        return
+
+    path = socket_path(storage.DB_PATH)
+    if os.path.exists(path):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+            print(f"A daemon is already serving {storage.DB_PATH} on {path}")
+            return
+        except ConnectionRefusedError:
+            os.unlink(path)
+
+    storage.load_db()
+    # Resident state makes the array copy of the ratings worth keeping
+    columnar.enable()
+    server = DaemonServer(path)
+    server.mark_seen()
+    print(f"Serving {storage.DB_PATH} on {path} (Ctrl+C to stop)")
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(path)
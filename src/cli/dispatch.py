@@ -1,55 +1,143 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from db.storage import load_db, save_db, DB_PATH
-from db.serialization import export_db, import_db
-from cli.players import add_player, list_players, delete_player
-from cli.matches import add_match, list_matches, edit_match, delete_match
-from cli.rankings import show_rankings, show_rankings_for_date
-from cli.util import undo
-from cli.snapshots import rebuild_all_snapshots
-
-
-def run_cli(args):
-    # Only load the DB if we're not importing from JSON
-    if args.cmd != "import":
+import profiling
+from db.storage import is_current, load_db, write_lock
+
+# Command modules are imported inside their branch so each command only
+# pays for what it uses (prompt_toolkit alone costs ~100 ms to import).
+
+
+def writes(args):
+    """Whether a command writes without prompting, so it can hold the lock.
+
+    matches edit prompts first and checks for conflicting saves afterwards.
+    """
+    if args.cmd in ("players", "matches"):
+        return args.action in ("add", "delete")
+    return args.cmd in ("undo", "redo", "batch", "import", "rebuild-snapshots")
+
+
+def reads_only(args):
+    """Whether a command answers from SQL alone, without loading the state.
+
+    These run through db.queries on a read-only connection, so they never
+    build DBState.
+    """
+    if args.cmd == "players":
+        return args.action in ("list", "history")
+    return args.cmd == "rankings"
+
+
+def run_cli(args, loaded=False):
+    with profiling.span(args.cmd):
+        if writes(args):
+            # Loads, changes and saves under one write lock, so concurrent
+            # writers queue up instead of overwriting each other
+            with write_lock():
+                _run_command(args, loaded and is_current())
+        else:
+            _run_command(args, loaded)
+
+
+def _run_command(args, loaded):
+    # Import and export read or write the database themselves, queries skip
+    # the state, and the daemon passes loaded=True since it keeps it resident
+    if args.cmd not in ("import", "export", "serve") and not (
+        loaded or reads_only(args)
+    ):
         load_db()
 
     if args.cmd == "players":
+        from cli.players import add_player, list_players, delete_player, show_history
+
         if args.action == "list":
             list_players()
         elif args.action == "add" and args.name:
             add_player(args.name)
         elif args.action == "delete" and args.name:
             delete_player(args.name)
+        elif args.action == "history" and args.name:
+            show_history(args.name, args.from_date, args.to_date)
 
     elif args.cmd == "rankings":
+        from cli.rankings import show_rankings, show_rankings_for_date
+
+        options = dict(
+            top=args.top, offset=args.offset, player=args.player, sort=args.sort
+        )
         if hasattr(args, "date") and args.date:
-            show_rankings_for_date(args.date)
+            show_rankings_for_date(args.date, **options)
         else:
-            show_rankings()
+            show_rankings(**options)
 
     elif args.cmd == "matches":
+        from cli.matches import add_match, list_matches, edit_match, delete_match
+
         if args.action == "add" and args.arg:
-            add_match(args.arg, args.time)
+            add_match(args.arg, args.time, args.scores)
         elif args.action == "list":
-            list_matches()
+            list_matches(args.deltas, args.from_date, args.to_date)
         elif args.action == "edit" and args.arg:
             edit_match(args.arg)
         elif args.action == "delete" and args.arg:
             delete_match(args.arg)
 
+    elif args.cmd == "matchmake":
+        from cli.matchmake import matchmake
+
+        matchmake(args.names, args.team_size)
+
+    elif args.cmd == "simulate":
+        from cli.simulate import simulate_schedule
+
+        simulate_schedule(
+            args.path, args.trials, args.workers, args.seed, args.top, args.sort
+        )
+
+    elif args.cmd == "tune":
+        from cli.tune import tune_parameters
+        from ratings import PARAMETERS
+
+        grids = {
+            name: getattr(args, name)
+            for name in PARAMETERS
+            if getattr(args, name) is not None
+        }
+        tune_parameters(grids, args.metric, args.workers, args.top, args.save)
+
     elif args.cmd == "undo":
+        from cli.util import undo
+
         undo()
 
+    elif args.cmd == "redo":
+        from cli.util import redo
+
+        redo()
+
     elif args.cmd == "import":
+        from db.serialization import import_db
+
         json_path = args.path if hasattr(args, "path") else "league.json"
-        import_db(json_path)
-        save_db()
-        print(f"DEBUG: Database saved to {DB_PATH}")
+        import_db(json_path, args.workers)
 
     elif args.cmd == "export":
+        from db.serialization import export_db
+
         json_path = args.path if hasattr(args, "path") else "league.json"
-        export_db(json_path)
+        export_db(json_path, args.format)
 
     elif args.cmd == "rebuild-snapshots":
-        rebuild_all_snapshots()
+        from cli.snapshots import rebuild_all_snapshots
+
+        rebuild_all_snapshots(args.workers)
+
+    elif args.cmd == "batch":
+        from cli.batch import run_batch
+
+        run_batch(args.path)
+
+    elif args.cmd == "serve":
+        from cli.daemon import serve
+
+        serve()
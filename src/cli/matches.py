@@ -2,65 +2,103 @@
 
 from collections import defaultdict
 from datetime import datetime
-from prompt_toolkit import prompt
-from prompt_toolkit.completion import WordCompleter
 
-from db.storage import DBState
-from db.player_days import regenerate_player_days_up_to
-from models import Match, Team
-from ratings import recalculate_ratings_from, update_ratings
-from cli.util import find_player, parse_participants, save
-
-
-def add_match(input_str, datetime_override=None):
+from db.storage import (
+    ConflictError,
+    DBState,
+    add_to_history,
+    connect,
+    intern_team,
+    is_current,
+    load_db,
+    mark_dirty,
+    match_row,
+    next_id,
+    remove_from_history,
+    write_lock,
+)
+from models import Match, MatchTeam
+from cli.util import (
+    ledger_range,
+    parse_participants,
+    player_names,
+    resolve_teams,
+    save,
+)
+
+
+def create_match(input_str, datetime_override=None, scores_str=None):
+    """Adds a match to the state without saving or replaying ratings."""
+    parsed, scores = parse_participants(input_str)
+    if scores_str:
+        scores = [int(s) for s in scores_str.split(",")]
+    resolved = resolve_teams(parsed)
+    for team, players_in_team in zip(parsed, resolved):
+        for name, player in zip(team, players_in_team):
+            if not player:
+                raise ValueError(f"Player '{name}' does not exist.")
+
+    match_datetime = (
+        datetime_override
+        if datetime_override and datetime.fromisoformat(datetime_override)
+        else datetime.now().isoformat(timespec="minutes")
+    )
+
+    match = Match(id=next_id("matches"), datetime=match_datetime)
+
+    for place, team_players in enumerate(resolved, start=1):
+        team = intern_team(team_players)
+        score = scores[place - 1] if len(scores) >= place else None
+        match.match_teams.append(MatchTeam(team, place, score))
+
+    add_to_history(match)
+    return match
+
+
+def add_match(input_str, datetime_override=None, scores_str=None):
     try:
-        parsed, scores = parse_participants(input_str)
-        resolved = []
-        for team in parsed:
-            players_in_team = []
-            for name in team:
-                player = find_player(name)
-                if not player:
-                    raise ValueError(f"Player '{name}' does not exist.")
-                players_in_team.append(player)
-            resolved.append(players_in_team)
-
-        update_ratings(*resolved)
-
-        match_id = max((m.id for m in DBState.matches), default=0) + 1
-        match = Match(id=match_id)
-
-        for place, team_players in enumerate(resolved, start=1):
-            team_id = max((t.id for t in DBState.teams), default=0) + 1
-            team = Team(id=team_id, players=team_players)
-            DBState.teams.append(team)
-            score = scores[place - 1] if len(scores) >= place else None
-            match.match_teams.append({"team": team, "place": place, "score": score})
-
-        match.datetime = (
-            datetime_override
-            if datetime_override and datetime.fromisoformat(datetime_override)
-            else datetime.now().isoformat(timespec="minutes")
-        )
-
-        DBState.matches.append(match)
-        save()
+        match = create_match(input_str, datetime_override, scores_str)
+        save(replay_from=match.date)
         print(f"Match recorded at {match.datetime}")
 
-        match_date = match.datetime.split("T")[0]
-        regenerate_player_days_up_to(match_date)
-
     except Exception as e:
         print(f"Error adding match: {e}")
 
 
-def list_matches():
-    if not DBState.matches:
+def list_matches(deltas=False, from_date=None, to_date=None):
+    matches = DBState.matches
+    if from_date or to_date:
+        # Compared as text, like the ledger query below
+        matches = [
+            m
+            for m in matches
+            if (not from_date or m.datetime >= from_date)
+            and (not to_date or m.date <= to_date)
+        ]
+    if not matches:
         print("No matches recorded.")
         return
+
+    # Each player's change in μ per match, from one range scan of the ledger
+    changes = {}
+    if deltas:
+        condition, params = ledger_range(from_date, to_date)
+        conn = connect()
+        c = conn.execute(
+            f"SELECT match_id, player_id, mu_after - mu_before FROM rating_ledger "
+            f"WHERE {condition}",
+            params,
+        )
+        changes = {(match_id, player_id): delta for match_id, player_id, delta in c}
+        conn.close()
+
+    def player_label(match, p):
+        delta = changes.get((match.id, p.id))
+        return p.name if delta is None else f"{p.name} ({delta:+.2f})"
+
     grouped = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
-    for match in DBState.matches:
-        dt = datetime.fromisoformat(match.datetime)
+    for match in matches:
+        dt = match.timestamp
         grouped[dt.year][dt.month][dt.day].append(match)
     for year in sorted(grouped):
         print(f"{year}:")
@@ -70,60 +108,51 @@ def list_matches():
                 print(f"    {day:02}:")
                 for match in grouped[year][month][day]:
                     team_str = " > ".join(
-                        f"[{', '.join(p.name for p in mt['team'].players)}]"
+                        f"[{', '.join(player_label(match, p) for p in mt.team.players)}]"
                         + (
-                            f" (score: {mt['score']})"
-                            if mt["score"] is not None
+                            f" (score: {mt.score})"
+                            if mt.score is not None
                             else ""
                         )
                         for mt in match.match_teams
                     )
                     print(
-                        f"      {datetime.fromisoformat(match.datetime).strftime('%H:%M')} : {match.id} -> {team_str}"
+                        f"      {match.timestamp.strftime('%H:%M')} : {match.id} -> {team_str}"
                     )
 
 
 def edit_match(match_id_str):
+    from prompt_toolkit import prompt
+    from prompt_toolkit.completion import WordCompleter
+
     try:
-        match_id = int(match_id_str)
-        match = next(m for m in DBState.matches if m.id == match_id)
-    except (ValueError, StopIteration):
+        match = DBState.matches_by_id[int(match_id_str)]
+    except (ValueError, KeyError):
         print(f"No match found with ID {match_id_str}")
         return
 
+    # What the prompts show, to tell whether another process changed it
+    shown = match_row(match)
+    original_date = match.date
     print(f"Editing match {match.id} ({match.datetime})")
     for i, entry in enumerate(match.match_teams, start=1):
-        names = ", ".join(p.name for p in entry["team"].players)
-        score_str = f" (score: {entry['score']})" if entry["score"] is not None else ""
+        names = ", ".join(p.name for p in entry.team.players)
+        score_str = f" (score: {entry.score})" if entry.score is not None else ""
         print(f"  {i}. {names}{score_str}")
 
-    player_names = [p.name for p in DBState.players]
-    player_completer = WordCompleter(player_names, ignore_case=True)
+    player_completer = WordCompleter(player_names(), ignore_case=True)
 
     try:
         new_input = prompt(
             "Enter new participants (comma-separated, use brackets for teams, optional 'score:') or leave blank to keep: ",
             completer=player_completer,
         )
+        resolved, scores = [], []
         if new_input.strip():
             entries, scores = parse_participants(new_input)
-            resolved = []
-            for entry in entries:
-                team = [find_player(name) for name in entry]
-                if None in team:
-                    raise ValueError("One or more player names not found.")
-                resolved.append(team)
-
-            if resolved:
-                match.match_teams = []
-                for place, team_players in enumerate(resolved, start=1):
-                    team_id = max((t.id for t in DBState.teams), default=0) + 1
-                    team = Team(id=team_id, players=team_players)
-                    DBState.teams.append(team)
-                    score = scores[place - 1] if len(scores) >= place else None
-                    match.match_teams.append(
-                        {"team": team, "place": place, "score": score}
-                    )
+            resolved = resolve_teams(entries)
+            if any(None in team for team in resolved):
+                raise ValueError("One or more player names not found.")
 
         new_dt = input(
             f"Enter new datetime (YYYY-MM-DDTHH:MM) [default: {match.datetime}]: "
@@ -131,33 +160,62 @@ def edit_match(match_id_str):
         if new_dt:
             try:
                 datetime.fromisoformat(new_dt)
-                match.datetime = new_dt
             except ValueError:
                 print("Invalid datetime format. Keeping existing time.")
+                new_dt = ""
+
+        # The prompts run without the write lock, so check that nobody saved
+        # in the meantime. Unrelated saves are reloaded and the edit applied
+        # on top; a change to this match itself is a conflict.
+        with write_lock():
+            if not is_current():
+                load_db()
+                match = DBState.matches_by_id.get(match.id)
+                if match is None or match_row(match) != shown:
+                    raise ConflictError(
+                        f"Match {match_id_str} was changed by another process "
+                        "while editing; nothing was saved."
+                    )
+                players_by_id = DBState.players_by_id
+                resolved = [
+                    [players_by_id.get(p.id) for p in team] for team in resolved
+                ]
+                if any(None in team for team in resolved):
+                    raise ConflictError(
+                        "A player was deleted by another process while editing; "
+                        "nothing was saved."
+                    )
 
-        recalculate_ratings_from(match.datetime)
-        save()
-        print("Match updated.")
+            if resolved:
+                match.match_teams = []
+                for place, team_players in enumerate(resolved, start=1):
+                    team = intern_team(team_players)
+                    score = scores[place - 1] if len(scores) >= place else None
+                    match.match_teams.append(MatchTeam(team, place, score))
+            if new_dt:
+                match.datetime = new_dt
+            mark_dirty("matches", match.id)
 
-        match_date = match.datetime.split("T")[0]
-        regenerate_player_days_up_to(match_date)
+            match_date = match.date
+            save(replay_from=min(original_date, match_date))
+        print("Match updated.")
 
     except Exception as e:
         print(f"Failed to edit match: {e}")
 
 
-def delete_match(match_id_str):
-    try:
-        match_id = int(match_id_str)
-        match = next(m for m in DBState.matches if m.id == match_id)
-        match_date = match.datetime.split("T")[0]
-        DBState.matches.remove(match)
+def remove_match(match_id_str):
+    """Removes a match from the state without saving or replaying ratings."""
+    match = DBState.matches_by_id[int(match_id_str)]
+    remove_from_history(match)
+    return match
 
-        recalculate_ratings_from(match.datetime)
-        save()
-        print(f"Match {match_id} deleted.")
 
-        regenerate_player_days_up_to(match_date)
+def delete_match(match_id_str):
+    try:
+        match = remove_match(match_id_str)
+        save(replay_from=match.date)
+        print(f"Match {match.id} deleted.")
 
-    except (ValueError, StopIteration):
+    except (ValueError, KeyError):
         print(f"No match found with ID {match_id_str}")
@@ -0,0 +1,216 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import math
+import random
+
+from trueskill import global_env
+import columnar
+from ratings import match_quality
+from cli.util import find_players
+
+# Swaps that raise the total quality by less than this are not worth taking
+MIN_GAIN = 1e-12
+# Times the best seating is shaken up and searched again, and the seed that
+# keeps the shakes (and so the suggestions) the same from run to run
+SHAKES = 8
+SEED = 1
+
+
+def quality_matrix(players):
+    """Pairwise 1v1 match quality, in one NumPy pass when it is installed."""
+    if columnar.available():
+        return columnar.quality_matrix(players).tolist()
+    return [[match_quality([a], [b]) for b in players] for a in players]
+
+
+def _initial_seats(players, team_size):
+    """A starting seating: seats 2k * g to 2k * (g + 1) are game g.
+
+    1v1 games pair players greedily by quality, best pairing first. Team
+    games group players by rating, strongest first, and split each group
+    snake-draft style (A B B A A B B A ...).
+    """
+    if team_size == 1:
+        matrix = quality_matrix(players)
+        pairs = sorted(
+            ((matrix[i][j], i, j) for i in range(len(players)) for j in range(i)),
+            reverse=True,
+        )
+        seated = set()
+        seats = []
+        for _, i, j in pairs:
+            if i not in seated and j not in seated:
+                seated.update((i, j))
+                seats += (players[i], players[j])
+        return seats + [p for i, p in enumerate(players) if i not in seated]
+
+    game_size = 2 * team_size
+    seats = sorted(players, key=lambda p: (-p.mu, p.id))
+    snake = sorted(range(game_size), key=lambda i: ((i + 1) // 2) % 2)
+    for start in range(0, len(seats) - game_size + 1, game_size):
+        group = seats[start : start + game_size]
+        seats[start : start + game_size] = [group[i] for i in snake]
+    return seats
+
+
+def _improve(seats, team_size, games):
+    """Swaps seats until no swap raises the total quality; returns the total.
+
+    Each team's summed mu and variance are kept up to date, so trying a
+    swap costs the same however large the teams are.
+    """
+    env = global_env()
+    spread = 2 * team_size * env.beta**2
+
+    def quality(mu_a, var_a, mu_b, var_b):
+        denom = spread + var_a + var_b
+        diff = mu_a - mu_b
+        return math.sqrt(spread / denom) * math.exp(-diff * diff / (2 * denom))
+
+    mus = [p.mu for p in seats]
+    variances = [p.sigma * p.sigma for p in seats]
+    team_mu = [sum(mus[t : t + team_size]) for t in range(0, len(seats), team_size)]
+    team_var = [
+        sum(variances[t : t + team_size]) for t in range(0, len(seats), team_size)
+    ]
+    teams = 2 * games
+    qualities = [
+        quality(
+            team_mu[2 * g], team_var[2 * g], team_mu[2 * g + 1], team_var[2 * g + 1]
+        )
+        for g in range(games)
+    ]
+
+    def moved(t, u, dm, dv):
+        """Game u's quality after team t gains dm in mu and dv in variance."""
+        first, second = 2 * u, 2 * u + 1
+        mu_a, var_a = team_mu[first], team_var[first]
+        mu_b, var_b = team_mu[second], team_var[second]
+        if t == first:
+            return quality(mu_a + dm, var_a + dv, mu_b, var_b)
+        return quality(mu_a, var_a, mu_b + dm, var_b + dv)
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(seats)):
+            ti = i // team_size
+            for j in range(i + 1, len(seats)):
+                tj = j // team_size
+                if ti == tj or ti >= teams and tj >= teams:
+                    continue
+                dm, dv = mus[j] - mus[i], variances[j] - variances[i]
+                gi, gj = ti // 2, tj // 2
+                if gi == gj:
+                    # Both teams of one game: the two changes cancel in size
+                    first = 2 * gi
+                    sign = 1 if ti == first else -1
+                    new_i = quality(
+                        team_mu[first] + sign * dm,
+                        team_var[first] + sign * dv,
+                        team_mu[first + 1] - sign * dm,
+                        team_var[first + 1] - sign * dv,
+                    )
+                    gain = new_i - qualities[gi]
+                    new_j = None
+                else:
+                    new_i = moved(ti, gi, dm, dv) if ti < teams else None
+                    new_j = moved(tj, gj, -dm, -dv) if tj < teams else None
+                    gain = 0.0
+                    if new_i is not None:
+                        gain += new_i - qualities[gi]
+                    if new_j is not None:
+                        gain += new_j - qualities[gj]
+                if gain <= MIN_GAIN:
+                    continue
+
+                seats[i], seats[j] = seats[j], seats[i]
+                mus[i], mus[j] = mus[j], mus[i]
+                variances[i], variances[j] = variances[j], variances[i]
+                team_mu[ti] += dm
+                team_var[ti] += dv
+                team_mu[tj] -= dm
+                team_var[tj] -= dv
+                if new_i is not None:
+                    qualities[gi] = new_i
+                if new_j is not None:
+                    qualities[gj] = new_j
+                improved = True
+    return sum(qualities)
+
+
+def suggest_games(players, team_size=1):
+    """Splits players into k-vs-k games for the highest total match quality.
+
+    Returns (games, bench): each game is a pair of teams with its quality,
+    and bench holds whoever is left over once every game is full.
+
+    From the starting seating, a local search swaps any two seats whenever
+    that raises the total quality, until no swap does; the bench counts for
+    nothing, so it also picks who sits out. To escape local optima, the
+    best seating is then shaken up a few times with random swaps and
+    searched again. The shakes use a fixed seed, so the same players always
+    get the same suggestion.
+    """
+    game_size = 2 * team_size
+    games = len(players) // game_size
+    seats = _initial_seats(players, team_size)
+    total = _improve(seats, team_size, games)
+    rng = random.Random(SEED)
+    for _ in range(SHAKES):
+        shaken = list(seats)
+        for _ in range(game_size):
+            i, j = rng.sample(range(len(shaken)), 2)
+            shaken[i], shaken[j] = shaken[j], shaken[i]
+        shaken_total = _improve(shaken, team_size, games)
+        if shaken_total > total + MIN_GAIN:
+            seats, total = shaken, shaken_total
+
+    suggested = []
+    for start in range(0, games * game_size, game_size):
+        middle = start + team_size
+        teams = (seats[start:middle], seats[middle : start + game_size])
+        suggested.append((teams, match_quality(*teams)))
+    suggested.sort(key=lambda game: -game[1])
+    return suggested, seats[games * game_size :]
+
+
+def matchmake(names, team_size=1):
+    """Prints suggested games among the players present."""
+    if team_size < 1:
+        print("Team size must be at least 1.")
+        return
+    names = list(dict.fromkeys(n.strip() for n in names.split(",") if n.strip()))
+    players = find_players(names)
+    missing = [name for name, player in zip(names, players) if player is None]
+    if missing:
+        for name in missing:
+            print(f"Player '{name}' not found.")
+        return
+    # Two spellings of one name resolve to the same player
+    players = list({p.id: p for p in players}.values())
+    if len(players) < 2 * team_size:
+        print(
+            f"Need at least {2 * team_size} players for "
+            f"{team_size}v{team_size} games."
+        )
+        return
+
+    games, bench = suggest_games(players, team_size)
+    sides = [
+        tuple(" + ".join(p.name for p in team) for team in teams) for teams, _ in games
+    ]
+    width = max(len(first) for first, _ in sides)
+    number_width = len(str(len(games)))
+    print(f"Suggested {team_size}v{team_size} games for {len(players)} players:")
+    for number, ((first, second), (_, quality)) in enumerate(
+        zip(sides, games), start=1
+    ):
+        print(
+            f"  {str(number).rjust(number_width)}. {first.ljust(width)} vs "
+            f"{second}  (quality {quality:.1%})"
+        )
+    if bench:
+        print(f"Sitting out: {', '.join(p.name for p in bench)}")
+    average = sum(quality for _, quality in games) / len(games)
+    print(f"Average quality: {average:.1%}")
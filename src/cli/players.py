@@ -1,38 +1,114 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-from db.storage import DBState
-from models import Player
-from cli.util import save
+from db import queries
+from db.storage import (
+    DBState,
+    add_to_roster,
+    next_id,
+    read_only,
+    remove_from_roster,
+)
+from cli.util import ledger_range, save
 
 
-def add_player(names):
+def create_players(names):
+    """Adds players to the state without saving, skipping taken names."""
+    from trueskill import Rating
+    from models import Player
+
     for name in names.split(","):
         name = name.strip()
         if not name:
             continue
-        if any(p.name.lower() == name.lower() for p in DBState.players):
+        if name.casefold() in DBState.players_by_name:
             print(f"Player '{name}' already exists.")
         else:
-            new_id = max((p.id for p in DBState.players), default=0) + 1
-            DBState.players.append(Player(new_id, name, mu=25.0, sigma=8.333))
+            rating = Rating()
+            add_to_roster(Player(next_id("players"), name, rating.mu, rating.sigma))
             print(f"Player '{name}' added.")
+
+
+def add_player(names):
+    create_players(names)
     save()
 
 
 def list_players():
-    if not DBState.players:
+    with read_only() as c:
+        names = list(queries.player_names(c))
+    if not names:
         print("No players found.")
         return
-    sorted_players = sorted(p.name for p in DBState.players)
-    print(", ".join(sorted_players))
+    print(", ".join(names))
+
+
+def remove_player(name):
+    """Removes a player from the state without saving; False if not found.
+
+    Raises ValueError if the player is on any match roster: their matches
+    could no longer be rated, so those are deleted first.
+    """
+    player = DBState.players_by_name.get(name.strip().casefold())
+    if player is None:
+        return False
+    for match in DBState.matches:
+        if any(p is player for mt in match.match_teams for p in mt.team.players):
+            raise ValueError(
+                f"Player '{player.name}' played in match {match.id}; "
+                "delete their matches first."
+            )
+    remove_from_roster(player)
+    return True
 
 
 def delete_player(name):
-    name = name.strip().lower()
-    index = next((i for i, p in enumerate(DBState.players) if p.name.lower() == name), None)
-    if index is not None:
-        del DBState.players[index]
+    try:
+        removed = remove_player(name)
+    except ValueError as e:
+        print(e)
+        return
+    if removed:
         save()
-        print(f"Deleted player '{name}'.")
+        print(f"Deleted player '{name.strip().lower()}'.")
     else:
-        print(f"Player '{name}' not found.")
+        print(f"Player '{name.strip().lower()}' not found.")
+
+
+def show_history(name, from_date=None, to_date=None):
+    """Lists a player's rating change in each match, from the rating ledger."""
+    with read_only() as c:
+        player = queries.find_player(c, name)
+        if player is None:
+            print(f"Player '{name}' not found.")
+            return
+        player_id, player_name = player
+
+        condition, params = ledger_range(from_date, to_date)
+        c.execute(
+            f"""
+            SELECT match_id, datetime, mu_before, sigma_before, mu_after, sigma_after
+            FROM rating_ledger
+            WHERE player_id = ? AND {condition}
+            ORDER BY datetime, match_id
+            """,
+            (player_id, *params),
+        )
+        rows = c.fetchall()
+        if not rows:
+            c.execute("SELECT EXISTS (SELECT 1 FROM rating_ledger)")
+            if not c.fetchone()[0]:
+                print(
+                    "No rating history recorded yet; run rebuild-snapshots to fill it."
+                )
+            else:
+                print(f"No rated matches for '{player_name}' in that range.")
+            return
+
+    print(f"Rating history for {player_name}:")
+    pad_width = len(str(max(match_id for match_id, *_ in rows)))
+    for match_id, match_datetime, mu0, sigma0, mu1, sigma1 in rows:
+        print(
+            f"  {match_datetime} #{str(match_id).ljust(pad_width)}"
+            f"  μ {mu0:6.2f} → {mu1:6.2f} ({mu1 - mu0:+.2f})"
+            f"  σ {sigma0:5.2f} → {sigma1:5.2f}"
+        )
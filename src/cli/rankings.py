@@ -1,58 +1,139 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import sqlite3
-from db.storage import DB_PATH, DBState
+import columnar
+from db import queries
+from db.storage import read_only
 
+# Players shown above and below the one asked for with --player
+NEIGHBOURS = 2
 
-def show_rankings_for_date(date_str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
 
-    c.execute("SELECT MAX(date) FROM player_days WHERE date <= ?", (date_str,))
-    result = c.fetchone()
-    latest_date = result[0] if result and result[0] else None
+def print_rankings(rows, total, sort="mu", highlight=None):
+    """Prints (rank, name, mu, sigma) rows, padding ranks to the total."""
+    pad_width = len(str(total))
+    longest_name = max(len(name) for _, name, _, _ in rows)
+    for rank, name, mu, sigma in rows:
+        line = (
+            f"({str(rank).rjust(pad_width)}) {name.ljust(longest_name)}"
+            f" - μ={mu:.2f}, σ={sigma:.2f}"
+        )
+        if sort == "conservative":
+            line += f", μ-3σ={mu - 3 * sigma:.2f}"
+        if name == highlight:
+            line += "  <"
+        print(line)
+
+
+def print_percentile(name, rank, total):
+    """Prints where a player stands as a share of the league."""
+    ahead_of = 100 * (total - rank) / total
+    print(f"{name} is ranked {rank} of {total}, ahead of {ahead_of:.1f}% of players.")
+
+
+def _valid_page(top, offset):
+    """Checks --top and --offset, printing why a page cannot be shown."""
+    if top is not None and top < 0:
+        print("Top cannot be negative.")
+        return False
+    if offset < 0:
+        print("Offset cannot be negative.")
+        return False
+    return True
 
-    if not latest_date:
-        print(f"No ranking data found on or before {date_str}")
-        conn.close()
+
+def _find_name(c, name):
+    player = queries.find_player(c, name)
+    if player is None:
+        print(f"Player '{name}' not found.")
+    return player
+
+
+def show_rankings_for_date(date_str, top=None, offset=0, player=None, sort="mu"):
+    """Shows the leaderboard as of a date, from the snapshots on or before it.
+
+    Only the requested page is fetched, and --player counts the players
+    ahead of the one asked for instead of ranking everyone in Python.
+    """
+    if not _valid_page(top, offset):
         return
+    with read_only() as c:
+        latest_date = queries.latest_date(c, date_str)
+        if not latest_date:
+            print(f"No ranking data found on or before {date_str}")
+            return
+
+        total = queries.count_players(c)
+        highlight = None
+        if player is not None:
+            found = _find_name(c, player)
+            if found is None:
+                return
+            player_id, highlight = found
+            ahead = queries.players_ahead(c, player_id, sort, latest_date)
+            offset = max(ahead - NEIGHBOURS, 0)
+            top = 2 * NEIGHBOURS + 1
 
-    c.execute(
-        """
-        SELECT p.name, pd.mu, pd.sigma
-        FROM player_days pd
-        JOIN players p ON pd.player_id = p.id
-        WHERE pd.date = ?
-        ORDER BY pd.mu DESC
-        """,
-        (latest_date,),
-    )
-    ranked_players = c.fetchall()
-    conn.close()
-
-    pad_width = len(str(len(ranked_players)))
-    longest_name = max(len(name) for name, _, _ in ranked_players)
+        rows = queries.leaderboard(c, sort, offset, top, latest_date)
+        shown = [(rank, *row) for rank, row in enumerate(rows, start=offset + 1)]
+
+    if not shown:
+        print(f"No players ranked beyond {offset}.")
+        return
 
     print(f"Rankings for {latest_date} (closest to requested: {date_str}):")
-    for idx, (name, mu, sigma) in enumerate(ranked_players, start=1):
-        print(
-            f"({str(idx).rjust(pad_width)}) {name.ljust(longest_name)} - μ={mu:.2f}, σ={sigma:.2f}"
-        )
+    print_rankings(shown, total, sort, highlight)
+    if highlight is not None:
+        print_percentile(highlight, ahead + 1, total)
+
+
+def show_rankings(top=None, offset=0, player=None, sort="mu"):
+    """Shows the current leaderboard, read in index order from players.
+
+    Only the requested page is fetched, and --player counts the players
+    ahead of the one asked for instead of ranking everyone. When the
+    columnar store is on (see columnar.enable), the sort and the count run
+    over its arrays instead.
+    """
+    if not _valid_page(top, offset):
+        return
+    store = columnar.store()
+    with read_only() as c:
+        total = len(store.players) if store is not None else queries.count_players(c)
+        if not total:
+            print("No players found.")
+            return
+
+        latest_date = queries.latest_date(c)
+        if not latest_date:
+            print("No ranking snapshots available.")
+            return
+
+        highlight = None
+        if player is not None:
+            found = _find_name(c, player)
+            if found is None:
+                return
+            player_id, highlight = found
+            if store is not None:
+                ahead = store.rank(player_id, sort) - 1
+            else:
+                ahead = queries.players_ahead(c, player_id, sort)
+            offset = max(ahead - NEIGHBOURS, 0)
+            top = 2 * NEIGHBOURS + 1
 
+        if store is not None:
+            end = None if top is None else offset + top
+            page = [store.players[i] for i in store.order(sort)[offset:end].tolist()]
+            rows = [(p.name, p.mu, p.sigma) for p in page]
+        else:
+            rows = queries.leaderboard(c, sort, offset, top)
+        shown = [(rank, *row) for rank, row in enumerate(rows, start=offset + 1)]
 
-def show_rankings():
-    if not DBState.players:
-        print("No players found.")
+    if not shown:
+        print(f"No players ranked beyond {offset}.")
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT MAX(date) FROM player_days")
-    result = c.fetchone()
-    conn.close()
-
-    latest_date = result[0] if result else None
-    if latest_date:
-        show_rankings_for_date(latest_date)
-    else:
-        print("No ranking snapshots available.")
+    print(f"Rankings for {latest_date} (closest to requested: {latest_date}):")
+    print_rankings(shown, total, sort, highlight)
+    if highlight is not None:
+        print_percentile(highlight, ahead + 1, total)
@@ -0,0 +1,120 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sys
+import time
+
+import columnar
+from db.storage import DBState
+from cli.util import parse_participants, resolve_teams
+
+
+def read_schedule(path):
+    """Reads one match per line, in the same syntax as matches add.
+
+    Returns the players taking part, in order of first appearance, and the
+    matches as pairs of index lists into them. Raises ValueError naming the
+    line of the first match that cannot be simulated.
+    """
+    players = []
+    index = {}
+    schedule = []
+    source = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    with source:
+        for lineno, line in enumerate(source, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            teams, _ = parse_participants(line)
+            if len(teams) != 2:
+                raise ValueError(
+                    f"Line {lineno}: simulate plays two-team matches, "
+                    f"not {len(teams)} teams."
+                )
+            resolved = resolve_teams(teams)
+            for team, team_players in zip(teams, resolved):
+                for name, player in zip(team, team_players):
+                    if player is None:
+                        raise ValueError(f"Line {lineno}: player '{name}' not found.")
+            ids = [p.id for team in resolved for p in team]
+            if len(set(ids)) < len(ids):
+                raise ValueError(f"Line {lineno}: a player is listed twice.")
+            for p in (p for team in resolved for p in team):
+                if p.id not in index:
+                    index[p.id] = len(players)
+                    players.append(p)
+            schedule.append(tuple([index[p.id] for p in team] for team in resolved))
+    return players, schedule
+
+
+def _percentile(counts, share):
+    """The smallest rank reached in at least share of the trials."""
+    needed = share * counts.sum()
+    running = 0
+    for rank, count in enumerate(counts.tolist()):
+        running += count
+        if running >= needed:
+            return rank
+    return len(counts) - 1
+
+
+def simulate_schedule(path, trials=100000, workers=None, seed=0, top=1, sort="mu"):
+    """Prints each scheduled player's finishing-rank distribution."""
+    if trials < 1:
+        print("Trials must be at least 1.")
+        return
+    if workers is not None and workers < 1:
+        print("Workers must be at least 1.")
+        return
+    if top < 1:
+        print("Top must be at least 1.")
+        return
+    if not columnar.available():
+        print("simulate needs NumPy; install it with 'pip install numpy'.")
+        return
+    import simulation
+
+    try:
+        players, schedule = read_schedule(path)
+    except (OSError, ValueError) as e:
+        print(f"Error reading schedule: {e}")
+        return
+    if not schedule:
+        print("No matches to simulate.")
+        return
+
+    def key(p):
+        return p.mu if sort == "mu" else p.mu - 3 * p.sigma
+
+    scheduled = {p.id for p in players}
+    others = [key(p) for p in DBState.players if p.id not in scheduled]
+    # The leaderboard now, ordered as rankings orders it
+    standing = sorted(DBState.players, key=lambda p: (-key(p), p.id))
+    now = {p.id: rank for rank, p in enumerate(standing, start=1)}
+
+    start = time.perf_counter()
+    counts = simulation.simulate(players, schedule, others, trials, seed, workers, sort)
+    elapsed = time.perf_counter() - start
+
+    ranks = range(counts.shape[1])
+    rows = []
+    for p, player_counts in zip(players, counts):
+        mean = sum(r * c for r, c in zip(ranks, player_counts.tolist())) / trials
+        in_top = player_counts[: top + 1].sum() / trials
+        spread = [_percentile(player_counts, share) for share in (0.1, 0.5, 0.9)]
+        rows.append((mean, p.name, now[p.id], in_top, spread))
+    rows.sort()
+
+    print(
+        f"Simulated {trials} trials of {len(schedule)} matches in {elapsed:.2f}s "
+        f"({trials / elapsed:,.0f} trials/s)."
+    )
+    width = max(len("Player"), *(len(name) for _, name, _, _, _ in rows))
+    print(
+        f"{'Player'.ljust(width)}  {'Now':>5}  {'Mean':>7}  {f'Top {top}':>7}"
+        f"  {'10%':>5}  {'50%':>5}  {'90%':>5}"
+    )
+    for mean, name, current, in_top, (low, median, high) in rows:
+        print(
+            f"{name.ljust(width)}  {current:>5}  {mean:>7.1f}  {in_top:>7.1%}"
+            f"  {low:>5}  {median:>5}  {high:>5}"
+        )
@@ -1,7 +1,14 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 from db.player_days import regenerate_all_player_days
+from db.storage import write_lock
+from cli.util import save
 
-def rebuild_all_snapshots():
-    regenerate_all_player_days()
+
+def rebuild_all_snapshots(workers=None):
+    with write_lock():
+        regenerate_all_player_days(workers)
+        # Keeps the current ratings (and so the leaderboard) in step with the
+        # rebuilt snapshots, e.g. after switching rating backends
+        save()
     print("Rebuilt player_days table for all match dates.")
@@ -0,0 +1,136 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import time
+
+import columnar
+import ratings
+from db import journal
+from db.storage import DBState, load_db, save_db, write_lock, write_settings
+
+METRICS = ("log-loss", "accuracy")
+# Candidates for parameters without a grid of their own, as multiples of
+# trueskill's defaults: 5 x 5 x 5 x 3 = 375 environments. mu only moves the
+# whole scale, so it keeps its current value.
+SCALES = {
+    "sigma": (0.5, 0.75, 1, 1.25, 1.5),
+    "beta": (0.5, 0.75, 1, 1.5, 2),
+    "tau": (0, 0.5, 1, 2, 4),
+}
+DRAW_PROBABILITIES = (0.0, 0.05, 0.1)
+
+
+def parse_values(text):
+    """Reads one parameter's grid: comma-separated numbers."""
+    values = [float(value) for value in text.split(",") if value.strip()]
+    if not values:
+        raise ValueError("no values given")
+    return list(dict.fromkeys(values))
+
+
+def candidate_values(grids):
+    """Each parameter's candidates: the grid given for it, or the default one."""
+    defaults = ratings.default_parameters()
+    values = {
+        name: [defaults[name] * scale for scale in SCALES[name]] for name in SCALES
+    }
+    values["mu"] = [ratings.parameters()["mu"]]
+    values["draw_probability"] = list(DRAW_PROBABILITIES)
+    for name, text in grids.items():
+        values[name] = parse_values(text)
+    return values
+
+
+def check(candidate):
+    """Returns why a candidate environment is invalid, or None."""
+    if candidate["sigma"] <= 0 or candidate["beta"] <= 0:
+        return "sigma and beta must be positive"
+    if candidate["tau"] < 0:
+        return "tau cannot be negative"
+    if not 0 <= candidate["draw_probability"] < 1:
+        return "draw probability must be at least 0 and below 1"
+    return None
+
+
+def tune_parameters(grids, metric="log-loss", workers=None, top=10, save=False):
+    """Grid-searches TrueSkill parameters and prints the best environments.
+
+    grids maps parameter names to comma-separated candidate values. With
+    save, the best environment is stored and every rating replayed under it.
+    """
+    if not columnar.available():
+        print("tune needs NumPy; install it with 'pip install numpy'.")
+        return
+    import tuning
+
+    try:
+        values = candidate_values(grids)
+    except ValueError as e:
+        print(f"Invalid parameter grid: {e}")
+        return
+    candidates = tuning.grid(values)
+    for candidate in candidates:
+        problem = check(candidate)
+        if problem:
+            print(f"Invalid parameter grid: {problem}.")
+            return
+    # Scored alongside the grid, to compare against
+    current = ratings.parameters()
+    if current not in candidates:
+        candidates.append(current)
+    if not DBState.matches:
+        print("No matches to tune on.")
+        return
+
+    start = time.perf_counter()
+    scored, scores = tuning.tune(DBState.matches, candidates, workers)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Replayed {len(DBState.matches)} matches under {len(candidates)} "
+        f"environments in {elapsed:.2f}s ({scored} scored)."
+    )
+    if not scored:
+        print("No two-team matches to score.")
+        return
+
+    if metric == "accuracy":
+        order = sorted(
+            range(len(candidates)), key=lambda i: (-scores[i][1], scores[i][0], i)
+        )
+    else:
+        order = sorted(range(len(candidates)), key=lambda i: (scores[i][0], i))
+    rank_of = {i: rank for rank, i in enumerate(order, start=1)}
+    current_index = candidates.index(current)
+    width = len(str(len(candidates)))
+    print(
+        f"{'Rank'.rjust(max(width, 4))}  {'mu':>7}  {'sigma':>7}  {'beta':>7}  "
+        f"{'tau':>7}  {'draw':>5}  {'log-loss':>8}  {'accuracy':>8}"
+    )
+    for i in order[:top] + ([current_index] if rank_of[current_index] > top else []):
+        candidate = candidates[i]
+        log_loss, accuracy = scores[i]
+        label = f"{rank_of[i]}{'*' if i == current_index else ''}"
+        print(
+            f"{label.rjust(max(width, 4))}  {candidate['mu']:>7.3f}  "
+            f"{candidate['sigma']:>7.3f}  {candidate['beta']:>7.3f}  "
+            f"{candidate['tau']:>7.4f}  {candidate['draw_probability']:>5.3f}  "
+            f"{log_loss:>8.4f}  {accuracy:>8.1%}"
+        )
+    print("* the current parameters")
+
+    best = candidates[order[0]]
+    if not save:
+        print("Run with --save to store the best parameters and replay ratings.")
+        return
+    from db.player_days import regenerate_player_days_from
+
+    with write_lock() as conn:
+        c = conn.cursor()
+        write_settings(c, best)
+        # Reloads under the new parameters, which also picks up any matches
+        # saved while tuning, and replays every rating with them
+        load_db()
+        regenerate_player_days_from(conn=conn)
+        save_db(conn=conn)
+        # Undo would bring back ratings from the old parameters
+        journal.clear(c)
+    print("Saved the best parameters and replayed all ratings under them.")
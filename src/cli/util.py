@@ -1,23 +1,69 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import copy
+import sys
 
-from rapidfuzz import process
-from db.storage import DBState, save_db
+import profiling
+from db import journal
+from db.storage import (
+    DBState,
+    apply_changes,
+    bump_revision,
+    load_db,
+    save_db,
+    write_lock,
+)
+
+
+def player_names():
+    """Returns the roster's names, cached until a player is added or removed."""
+    if DBState.name_choices is None:
+        DBState.name_choices = (
+            [p.name for p in DBState.players],
+            list(DBState.players),
+        )
+    return DBState.name_choices[0]
+
+
+@profiling.timed("find_players")
+def find_players(names):
+    """Resolves names to players in one pass, with None for unknown names.
+
+    Exact matches ignore case. The rest are fuzzy-matched against the cached
+    roster, and each distinct miss is looked up (and reported) only once.
+    """
+    by_name = DBState.players_by_name
+    found = [by_name.get(name.casefold()) for name in names]
+    misses = dict.fromkeys(n for n, p in zip(names, found) if p is None)
+    profiling.count("names_resolved", len(names))
+    if not misses:
+        return found
+    profiling.count("fuzzy_lookups", len(misses))
+
+    from rapidfuzz import process
+
+    choices = player_names()
+    players = DBState.name_choices[1]
+    guesses = {}
+    for name in misses:
+        best = process.extractOne(name, choices, score_cutoff=80)
+        if best:
+            suggestion, _, index = best
+            print(f"No exact match for '{name}'. Did you mean '{suggestion}'?")
+            guesses[name] = players[index]
+    return [
+        player if player is not None else guesses.get(name)
+        for name, player in zip(names, found)
+    ]
 
 
 def find_player(name):
-    lowered = name.lower()
-    for p in DBState.players:
-        if p.name.lower() == lowered:
-            return p
-    player_names = [p.name for p in DBState.players]
-    matches_found = process.extract(name, player_names, limit=1, score_cutoff=80)
-    if matches_found:
-        suggestion, _, _ = matches_found[0]
-        print(f"No exact match for '{name}'. Did you mean '{suggestion}'?")
-        return next(p for p in DBState.players if p.name == suggestion)
-    return None
+    return find_players([name])[0]
+
+
+def resolve_teams(teams):
+    """Resolves a list of teams of names; unknown names come back as None."""
+    players = iter(find_players([name for team in teams for name in team]))
+    return [[next(players) for _ in team] for team in teams]
 
 
 def parse_participants(input_str):
@@ -55,23 +101,88 @@ def parse_participants(input_str):
 
     return participants, scores
 
-previous_state = None
 
-def save():
-    global previous_state
-    previous_state = (
-        copy.deepcopy(DBState.players),
-        copy.deepcopy(DBState.teams),
-        copy.deepcopy(DBState.matches),
-    )
-    save_db()
+def ledger_range(from_date=None, to_date=None):
+    """Returns a SQL condition and parameters for a date range on datetime."""
+    conditions = []
+    params = []
+    if from_date:
+        conditions.append("datetime >= ?")
+        params.append(from_date)
+    if to_date:
+        # Dates are inclusive; datetimes on to_date sort after the bare date
+        conditions.append("datetime < date(?, '+1 day')")
+        params.append(to_date)
+    return " AND ".join(conditions) or "1", params
+
+
+# Describes the running command in the undo journal
+command_label = None
+
+
+def set_command_label(label):
+    global command_label
+    command_label = label
+
+
+def save(replay_from=None):
+    """Saves the state, first replaying ratings from replay_from if given.
+
+    Both run in one write transaction, so they are saved together or not
+    at all.
+    """
+    from db.player_days import regenerate_player_days_from
+
+    with write_lock() as conn:
+        if replay_from is not None:
+            regenerate_player_days_from(replay_from, conn=conn)
+        save_db(command_label or " ".join(sys.argv[1:]), conn=conn)
+
+
+def _replay_changed_matches(changes):
+    """Reloads the state and rebuilds snapshots from the earliest match touched."""
+    from db.player_days import regenerate_player_days_from
+
+    load_db()
+    dates = [
+        row[0].split("T")[0]
+        for _, before, after in changes["matches"]
+        for row in (before, after)
+        if row is not None
+    ]
+    if dates:
+        regenerate_player_days_from(min(dates))
 
 
 def undo():
-    global previous_state
-    if previous_state is None:
+    with write_lock() as conn:
+        c = conn.cursor()
+        entry = journal.last_done(c)
+        if entry is not None:
+            entry_id, label, changes = entry
+            apply_changes(c, changes, reverse=True)
+            journal.mark(c, entry_id, undone=True)
+            bump_revision(c)
+            _replay_changed_matches(changes)
+
+    if entry is None:
         print("No operation to undo.")
         return
-    DBState.players[:], DBState.teams[:], DBState.matches[:] = copy.deepcopy(previous_state)
-    save_db()
-    print("Last operation undone.")
\ No newline at end of file
+    print(f"Undone: {label}")
+
+
+def redo():
+    with write_lock() as conn:
+        c = conn.cursor()
+        entry = journal.first_undone(c)
+        if entry is not None:
+            entry_id, label, changes = entry
+            apply_changes(c, changes)
+            journal.mark(c, entry_id, undone=False)
+            bump_revision(c)
+            _replay_changed_matches(changes)
+
+    if entry is None:
+        print("No operation to redo.")
+        return
+    print(f"Redone: {label}")
@@ -0,0 +1,200 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Optional NumPy column store for ratings and matches.
+
+PlayerColumns mirrors the loaded players' ratings as float64 arrays over a
+dense player index, so leaderboard sorts and rank lookups are array
+operations. MatchColumns lays matches out CSR-style (match -> teams ->
+player indices) for tuning, which rates many matches per NumPy call.
+
+NumPy is not a requirement: available() tells callers whether to use this
+module or keep their pure-Python path. It is imported on first use, so
+commands that never touch the store do not pay for the import.
+"""
+
+import importlib.util
+from itertools import repeat
+
+np = None
+
+# The daemon turns the store on; it is built from DBState on first use,
+# dropped when the roster changes and kept in step as ratings are written
+ENABLED = False
+STORE = None
+
+
+def available():
+    return np is not None or importlib.util.find_spec("numpy") is not None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+
+        np = numpy
+    return np
+
+
+def enable():
+    """Turns the store on if NumPy is installed; returns whether it is on."""
+    global ENABLED
+    ENABLED = available()
+    return ENABLED
+
+
+def store():
+    """Returns the store for DBState, building it if needed; None when off."""
+    global STORE
+    if not ENABLED:
+        return None
+    if STORE is None:
+        from db.storage import DBState
+
+        STORE = PlayerColumns(DBState.players)
+    return STORE
+
+
+def invalidate():
+    """Drops the store after the roster changes; the next store() rebuilds it."""
+    global STORE
+    STORE = None
+
+
+def on_update(players):
+    """Copies the ratings update_ratings just wrote into the store."""
+    if STORE is not None:
+        STORE.update(players)
+
+
+def sync():
+    """Copies every rating into the store after a bulk change such as a replay."""
+    if STORE is not None:
+        STORE.refresh()
+
+
+class PlayerColumns:
+    """mu and sigma as float64 arrays, indexed like the players list."""
+
+    def __init__(self, players):
+        np = _numpy()
+        self.players = list(players)
+        self.index = {p.id: i for i, p in enumerate(self.players)}
+        count = len(self.players)
+        self.ids = np.fromiter((p.id for p in self.players), np.int64, count)
+        self.mu = np.empty(count)
+        self.sigma = np.empty(count)
+        self.refresh()
+
+    def refresh(self):
+        count = len(self.players)
+        self.mu[:] = np.fromiter((p.mu for p in self.players), np.float64, count)
+        self.sigma[:] = np.fromiter((p.sigma for p in self.players), np.float64, count)
+
+    def update(self, players):
+        index = self.index
+        for p in players:
+            i = index.get(p.id)
+            if i is not None:
+                self.mu[i] = p.mu
+                self.sigma[i] = p.sigma
+
+    def key(self, sort="mu"):
+        """The ranking key, computed as db.queries.SORT_KEYS does in SQL."""
+        return self.mu if sort == "mu" else self.mu - 3 * self.sigma
+
+    def order(self, sort="mu"):
+        """Player indices in leaderboard order: key descending, then id."""
+        return np.lexsort((self.ids, -self.key(sort)))
+
+    def rank(self, player_id, sort="mu"):
+        """A player's 1-based rank, counted without sorting everyone."""
+        key = self.key(sort)
+        value = key[self.index[player_id]]
+        ahead = np.count_nonzero(key > value)
+        ahead += np.count_nonzero((key == value) & (self.ids < player_id))
+        return int(ahead) + 1
+
+
+def quality_matrix(players):
+    """ratings.match_quality for every 1v1 pairing of players at once.
+
+    Entry [i][j] is the quality of players[i] against players[j].
+    """
+    from trueskill import global_env
+
+    np = _numpy()
+    env = global_env()
+    count = len(players)
+    mu = np.fromiter((p.mu for p in players), np.float64, count)
+    sigma = np.fromiter((p.sigma for p in players), np.float64, count)
+    spread = 2 * env.beta**2
+    variance = sigma * sigma
+    denom = spread + variance[:, None] + variance[None, :]
+    diff = mu[:, None] - mu[None, :]
+    return np.sqrt(spread / denom) * np.exp(-diff * diff / (2 * denom))
+
+
+class MatchColumns:
+    """Matches in CSR layout over a dense player index.
+
+    Match m has teams match_offsets[m]:match_offsets[m + 1], and team t has
+    players slot_players[team_offsets[t]:team_offsets[t + 1]]. places and
+    scores are per team, with NaN for no score.
+
+    Building the layout also schedules the matches for tuning: a
+    match goes in the wave after the latest wave of any of its players, so
+    each player's matches keep their order and no player plays twice in a
+    wave. vectorized marks the matches with two non-empty teams and no
+    player listed twice, which the array update can rate.
+    """
+
+    def __init__(self, matches, index):
+        np = _numpy()
+        self.matches = matches
+        match_offsets = [0]
+        team_offsets = [0]
+        slot_players = []
+        places = []
+        scores = []
+        waves = []
+        vectorized = []
+        latest = {}
+        team_slots = {}
+        for match in matches:
+            participants = []
+            for mt in match.match_teams:
+                slots = team_slots.get(mt.team)
+                if slots is None:
+                    slots = team_slots[mt.team] = [index[p.id] for p in mt.team.players]
+                participants += slots
+                team_offsets.append(team_offsets[-1] + len(slots))
+                places.append(mt.place)
+                scores.append(mt.score)
+            match_offsets.append(len(places))
+            slot_players += participants
+
+            wave = 1 + max(map(latest.get, participants, repeat(0)), default=0)
+            latest.update(zip(participants, repeat(wave)))
+            waves.append(wave)
+            vectorized.append(
+                len(match.match_teams) == 2
+                and team_offsets[-3] < team_offsets[-2] < team_offsets[-1]
+                and len(set(participants)) == len(participants)
+            )
+
+        count = len(matches)
+        self.ids = np.fromiter((m.id for m in matches), np.int64, count)
+        self.match_offsets = np.array(match_offsets, dtype=np.int64)
+        self.team_offsets = np.array(team_offsets, dtype=np.int64)
+        self.slot_players = np.array(slot_players, dtype=np.int64)
+        self.places = np.array(places, dtype=np.int64)
+        # None becomes NaN
+        self.scores = np.array(scores, dtype=np.float64)
+        self.waves = np.array(waves, dtype=np.int64)
+        self.vectorized = np.array(vectorized, dtype=bool)
+
+    def schedule(self):
+        """Returns the waves in order, as arrays of match indices."""
+        order = np.argsort(self.waves, kind="stable")
+        bounds = np.flatnonzero(np.diff(self.waves[order])) + 1
+        return np.split(order, bounds)
@@ -0,0 +1,62 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import json
+
+# Number of operations kept for undo
+DEPTH = 20
+
+
+def set_depth(depth):
+    global DEPTH
+    DEPTH = max(depth, 0)
+
+
+def record(c, changes, label=None):
+    """Stores the before/after row images of one operation.
+
+    A new operation discards anything that was undone (the redo stack), and
+    only the latest DEPTH operations are kept.
+    """
+    c.execute("DELETE FROM journal WHERE undone = 1")
+    if not DEPTH or not any(changes.values()):
+        return
+    c.execute(
+        "INSERT INTO journal (label, changes) VALUES (?, ?)",
+        (label, json.dumps(changes)),
+    )
+    c.execute(
+        "DELETE FROM journal WHERE id NOT IN "
+        "(SELECT id FROM journal ORDER BY id DESC LIMIT ?)",
+        (DEPTH,),
+    )
+
+
+def clear(c):
+    c.execute("DELETE FROM journal")
+
+
+def last_done(c):
+    """Returns (id, label, changes) of the operation undo would revert."""
+    c.execute(
+        "SELECT id, label, changes FROM journal WHERE undone = 0 ORDER BY id DESC LIMIT 1"
+    )
+    return _decode(c.fetchone())
+
+
+def first_undone(c):
+    """Returns (id, label, changes) of the operation redo would reapply."""
+    c.execute(
+        "SELECT id, label, changes FROM journal WHERE undone = 1 ORDER BY id LIMIT 1"
+    )
+    return _decode(c.fetchone())
+
+
+def mark(c, entry_id, undone):
+    c.execute("UPDATE journal SET undone = ? WHERE id = ?", (int(undone), entry_id))
+
+
+def _decode(row):
+    if row is None:
+        return None
+    entry_id, label, changes = row
+    return entry_id, label, json.loads(changes)
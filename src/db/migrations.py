@@ -0,0 +1,164 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Schema changes for databases created from an older schemas.sql.
+
+PRAGMA user_version counts the migrations a database has been through.
+schemas.sql holds the original schema, so new databases take the same
+path as old ones.
+"""
+
+
+def dedupe_teams(c):
+    """Points match_teams at one team per lineup and deletes the duplicates."""
+    c.execute("SELECT id FROM teams ORDER BY id")
+    members = {team_id: [] for (team_id,) in c.fetchall()}
+    c.execute("SELECT team_id, player_id FROM team_players")
+    for team_id, player_id in c:
+        if team_id in members:
+            members[team_id].append(player_id)
+
+    canonical = {}
+    duplicates = []
+    for team_id, pids in members.items():
+        keep = canonical.setdefault(tuple(sorted(pids)), team_id)
+        if keep != team_id:
+            duplicates.append((team_id, keep))
+    if not duplicates:
+        return 0
+
+    c.execute("CREATE TEMP TABLE team_remap (dup integer primary key, keep integer)")
+    c.executemany("INSERT INTO team_remap (dup, keep) VALUES (?, ?)", duplicates)
+    c.execute(
+        "UPDATE match_teams SET team_id = "
+        "(SELECT keep FROM team_remap WHERE dup = match_teams.team_id) "
+        "WHERE team_id IN (SELECT dup FROM team_remap)"
+    )
+    c.execute("DELETE FROM team_players WHERE team_id IN (SELECT dup FROM team_remap)")
+    c.execute("DELETE FROM teams WHERE id IN (SELECT dup FROM team_remap)")
+    c.execute("DROP TABLE team_remap")
+    return len(duplicates)
+
+
+def add_journal(c):
+    # Creates the journal table for databases from before undo/redo
+    c.execute(
+        """
+        create table if not exists journal (
+          id integer primary key autoincrement,
+          label text,
+          changes text not null, -- JSON row images: {table: [[id, before, after], ...]}
+          undone integer not null default 0
+        )
+        """
+    )
+
+
+def add_indexes(c):
+    # Snapshot lookups and deletes by date, match_teams reloads and rewrites
+    # per match, and history queries by time
+    c.execute(
+        "create index if not exists player_days_date on player_days (date, player_id)"
+    )
+    c.execute("create index if not exists match_teams_match on match_teams (match_id)")
+    c.execute("create index if not exists matches_datetime on matches (datetime)")
+
+
+def add_leaderboard_indexes(c):
+    # players holds current ratings, so these keep it in leaderboard order
+    # for each rankings sort key (see db.queries.SORT_KEYS)
+    c.execute("create index if not exists players_mu on players (mu desc, id)")
+    c.execute(
+        "create index if not exists players_conservative "
+        "on players (mu - 3 * sigma desc, id)"
+    )
+
+
+def add_rating_ledger(c):
+    # Each participant's rating before and after every match, written by the
+    # replay. Existing databases fill it on their next full replay.
+    c.execute(
+        """
+        create table if not exists rating_ledger (
+          match_id integer not null,
+          player_id integer not null,
+          datetime text not null,
+          mu_before real not null,
+          sigma_before real not null,
+          mu_after real not null,
+          sigma_after real not null,
+          primary key (match_id, player_id)
+        ) without rowid
+        """
+    )
+    c.execute(
+        "create index if not exists rating_ledger_player "
+        "on rating_ledger (player_id, datetime)"
+    )
+    c.execute(
+        "create index if not exists rating_ledger_datetime on rating_ledger (datetime)"
+    )
+
+
+def add_revision(c):
+    # Bumped by every save, so a process can tell whether the state it loaded
+    # is still current (see db.storage.check_revision)
+    c.execute("create table if not exists revision (value integer not null)")
+    c.execute(
+        "insert into revision (value) "
+        "select 0 where not exists (select 1 from revision)"
+    )
+
+
+def add_settings(c):
+    # TrueSkill environment parameters chosen with the tune command; missing
+    # names keep trueskill's defaults (see db.storage.apply_settings)
+    c.execute(
+        "create table if not exists settings "
+        "(name text primary key, value real not null)"
+    )
+
+
+def add_name_index(c):
+    # Exact name lookups for commands that skip loading the state (see
+    # db.queries.find_player)
+    c.execute(
+        "create index if not exists players_name_nocase "
+        "on players (name collate nocase)"
+    )
+
+
+MIGRATIONS = [
+    dedupe_teams,
+    add_journal,
+    add_indexes,
+    add_leaderboard_indexes,
+    add_rating_ledger,
+    add_revision,
+    add_settings,
+    add_name_index,
+]
+VERSION = len(MIGRATIONS)
+
+
+def migrate(conn):
+    """Brings the database up to VERSION; returns how many migrations ran.
+
+    Each migration commits together with its version bump, and the version
+    is re-read under the write lock so concurrent starts apply it once.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= VERSION:
+        return 0
+    applied = 0
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= VERSION:
+            conn.rollback()
+            return applied
+        try:
+            MIGRATIONS[version](conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version + 1}")
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied += 1
@@ -1,74 +1,287 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
-import sqlite3
+import os
 
-from datetime import datetime, time
 from trueskill import Rating
-from db.storage import DB_PATH, DBState
+import columnar
+import profiling
+import ratings
+from db.storage import DBState, mark_dirty, transaction
+from models import Match, MatchTeam, Player, Team
 
+# Full rebuilds with fewer matches than this are replayed serially, since
+# starting the process pool costs more than it saves.
+PARALLEL_MIN_MATCHES = 5000
 
-def regenerate_player_days_up_to(date_str):
-    cutoff = datetime.combine(datetime.fromisoformat(date_str), time(23, 59, 59))
-    matches = DBState.matches
 
-    # Parse match datetimes properly
-    matches_sorted = sorted(
-        [m for m in matches if datetime.fromisoformat(m.datetime) <= cutoff],
-        key=lambda m: datetime.fromisoformat(m.datetime),
-    )
+def restore_ratings_before(c, date_str, matches_sorted=()):
+    """Resets players to their latest snapshot strictly before date_str.
 
-    if not matches_sorted:
-        print("No matches to apply.")
+    Only the players a replay of matches_sorted can change are reset: those
+    in the matches, and those with snapshots on or after date_str, which are
+    about to be deleted. Everyone else's latest snapshot is already before
+    date_str. Players without an earlier snapshot go back to the default
+    rating, and passing None for date_str resets everyone. Reset players are
+    marked dirty, which covers every rating the replay then changes.
+    """
+    if date_str is None:
+        for p in DBState.players:
+            p.trueskill = Rating()
+            mark_dirty("players", p.id)
         return
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    player_ids = {
+        p.id
+        for match in matches_sorted
+        for mt in match.match_teams
+        for p in mt.team.players
+    }
+    c.execute("SELECT DISTINCT player_id FROM player_days WHERE date >= ?", (date_str,))
+    player_ids.update(player_id for (player_id,) in c)
+
+    players_by_id = DBState.players_by_id
+    for player_id in player_ids:
+        player = players_by_id.get(player_id)
+        if player is None:
+            continue
+        player.trueskill = Rating()
+        mark_dirty("players", player_id)
+        # Reads one row through the (player_id, date) unique index
+        c.execute(
+            "SELECT mu, sigma FROM player_days WHERE player_id = ? AND date < ? "
+            "ORDER BY date DESC LIMIT 1",
+            (player_id, date_str),
+        )
+        row = c.fetchone()
+        if row is not None:
+            player.mu, player.sigma = row
 
-    # Clear existing snapshots for all affected days
-    affected_dates = sorted(set(m.datetime.split("T")[0] for m in matches_sorted))
-    for d in affected_dates:
-        c.execute("DELETE FROM player_days WHERE date = ?", (d,))
 
-    # Reset ratings
-    for p in DBState.players:
-        p.trueskill = Rating()
+def replay_matches(matches_sorted, last_saved, ledger=None):
+    """Applies matches in order and returns the sparse snapshot rows.
 
-    previous_date = None
+    Snapshots are sparse: a player only gets a row on a day their rating
+    changed, and readers take the latest row on or before a date. Only
+    players in last_saved (id -> last stored rating) get rows; rows come out
+    ordered by date, then player id. If a ledger list is given, it gets one
+    rating_ledger row per participant per match.
+    """
+    touched = {}
+    rows = []
 
     for i, match in enumerate(matches_sorted):
-        match_date = match.datetime.split("T")[0]
+        match_date = match.date
+        participants = [p for entry in match.match_teams for p in entry.team.players]
+        if ledger is not None:
+            before = [(p.mu, p.sigma) for p in participants]
         match.apply_results()
-
-        # Only print once per date
-        # if match_date != previous_date:
-        #     print(f"Applying matches for {match_date}...")
-        #     previous_date = match_date
+        for p in participants:
+            touched[p.id] = p
+        if ledger is not None:
+            ledger.extend(
+                (match.id, p.id, match.datetime, *rating, p.mu, p.sigma)
+                for p, rating in zip(participants, before)
+            )
 
         # Save snapshot if:
         # - It's the last match, or
         # - The next match is on a different date
         is_last_match = i == len(matches_sorted) - 1
-        next_match_date = (
-            matches_sorted[i + 1].datetime.split("T")[0] if not is_last_match else None
-        )
+        next_match_date = matches_sorted[i + 1].date if not is_last_match else None
         if is_last_match or next_match_date != match_date:
-            for p in DBState.players:
-                c.execute(
-                    "INSERT INTO player_days (player_id, date, mu, sigma) VALUES (?, ?, ?, ?)",
-                    (p.id, match_date, p.mu, p.sigma),
+            for player_id in sorted(touched):
+                p = touched[player_id]
+                rating = (p.mu, p.sigma)
+                if player_id in last_saved and last_saved[player_id] != rating:
+                    rows.append((player_id, match_date, *rating))
+                    last_saved[player_id] = rating
+            touched.clear()
+
+    return rows
+
+
+def split_components(matches_sorted):
+    """Groups match indices into connected components of the player graph.
+
+    Players in different components never meet, so each component can be
+    replayed on its own. Indices within a component stay in order.
+    """
+    parent = {}
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    participants = [
+        [p.id for entry in match.match_teams for p in entry.team.players]
+        for match in matches_sorted
+    ]
+    for ids in participants:
+        for player_id in ids:
+            parent.setdefault(player_id, player_id)
+        for player_id in ids[1:]:
+            a, b = find(ids[0]), find(player_id)
+            if a != b:
+                parent[b] = a
+
+    components = {}
+    for i, ids in enumerate(participants):
+        components.setdefault(find(ids[0]) if ids else None, []).append(i)
+    return list(components.values())
+
+
+def _replay_component_group(payload):
+    """Process pool worker: replays one group of independent components."""
+    backend, parameters, initial, tracked, matches = payload
+    ratings.set_backend(backend)
+    ratings.set_parameters(parameters)
+    players = {
+        pid: Player(pid, None, mu, sigma) for pid, (mu, sigma) in initial.items()
+    }
+    matches_sorted = []
+    for match_id, match_datetime, match_teams in matches:
+        entries = [
+            MatchTeam(Team(None, [players[pid] for pid in team]), place, score)
+            for team, place, score in match_teams
+        ]
+        matches_sorted.append(Match(match_id, entries, datetime=match_datetime))
+    last_saved = {pid: initial[pid] for pid in tracked}
+    ledger = []
+    rows = replay_matches(matches_sorted, last_saved, ledger)
+    return rows, ledger, {pid: (p.mu, p.sigma) for pid, p in players.items()}
+
+
+def replay_matches_parallel(matches_sorted, last_saved, workers, ledger=None):
+    """Replays independent components on a process pool.
+
+    Produces the same ratings and rows, in the same order, as
+    replay_matches, because each component sees its matches in the same
+    order and float operations as the serial replay. Ratings cross the
+    process boundary as (mu, sigma) floats, the same values players hold.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    components = sorted(split_components(matches_sorted), key=len, reverse=True)
+    groups = [[] for _ in range(min(workers * 2, len(components)))]
+    for component in components:
+        min(groups, key=len).extend(component)
+
+    players = {}
+    payloads = []
+    for group in groups:
+        group.sort()
+        initial = {}
+        matches = []
+        for i in group:
+            match = matches_sorted[i]
+            match_teams = []
+            for mt in match.match_teams:
+                for p in mt.team.players:
+                    players[p.id] = p
+                    initial[p.id] = (p.mu, p.sigma)
+                team = [p.id for p in mt.team.players]
+                match_teams.append((team, mt.place, mt.score))
+            matches.append((match.id, match.datetime, match_teams))
+        tracked = [pid for pid in initial if pid in last_saved]
+        payloads.append(
+            (ratings.BACKEND, ratings.parameters(), initial, tracked, matches)
+        )
+
+    # Workers keep their own counters, so count their calls here: one per match
+    profiling.count("rating_calls", len(matches_sorted))
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for group_rows, group_ledger, final in pool.map(
+            _replay_component_group, payloads
+        ):
+            rows.extend(group_rows)
+            if ledger is not None:
+                ledger.extend(group_ledger)
+            for pid, (mu, sigma) in final.items():
+                players[pid].mu, players[pid].sigma = mu, sigma
+
+    rows.sort(key=lambda row: (row[1], row[0]))
+    return rows
+
+
+@profiling.timed("regenerate_player_days")
+def regenerate_player_days_from(date_str=None, workers=None, conn=None):
+    """Replays every match on or after date_str and rewrites its snapshots.
+
+    The rating_ledger rows for those matches are rewritten along with them.
+
+    Ratings are restored from the snapshots before date_str, so the cost
+    depends on the matches since that date rather than the whole history.
+    Passing None replays everything; large full replays are split into
+    independent player components and run on up to workers processes.
+    Pass conn to write the snapshots in the caller's transaction.
+    """
+    with transaction(conn) as c:
+        # A database migrated before the ledger existed has no earlier rows to
+        # keep, so its first replay covers the whole history
+        if date_str is not None:
+            c.execute("SELECT EXISTS (SELECT 1 FROM rating_ledger)")
+            if not c.fetchone()[0]:
+                date_str = None
+
+        matches_sorted = sorted(
+            (m for m in DBState.matches if date_str is None or m.date >= date_str),
+            key=lambda m: m.timestamp,
+        )
+
+        with profiling.span("restore"):
+            restore_ratings_before(c, date_str, matches_sorted)
+
+            # Every snapshot and ledger row from the change point on is
+            # rebuilt from the replay below
+            if date_str is None:
+                c.execute("DELETE FROM player_days")
+                profiling.count("snapshot_rows_deleted", max(c.rowcount, 0))
+                c.execute("DELETE FROM rating_ledger")
+            else:
+                c.execute("DELETE FROM player_days WHERE date >= ?", (date_str,))
+                profiling.count("snapshot_rows_deleted", max(c.rowcount, 0))
+                c.execute("DELETE FROM rating_ledger WHERE datetime >= ?", (date_str,))
+
+        last_saved = {p.id: (p.mu, p.sigma) for p in DBState.players}
+        workers = workers or os.cpu_count() or 1
+        full_rebuild = date_str is None and len(matches_sorted) >= PARALLEL_MIN_MATCHES
+        ledger = []
+        with profiling.span("replay"):
+            if full_rebuild and workers > 1:
+                rows = replay_matches_parallel(
+                    matches_sorted, last_saved, workers, ledger
                 )
-            # print(f"Snapshot saved for {match_date}")
+            else:
+                rows = replay_matches(matches_sorted, last_saved, ledger)
+        profiling.count("matches_replayed", len(matches_sorted))
+        columnar.sync()
 
-    conn.commit()
-    conn.close()
-    # print(f"Regenerated player_days up to {date_str}")
+        with profiling.span("write"):
+            c.executemany(
+                "INSERT INTO player_days (player_id, date, mu, sigma) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # OR REPLACE: a player listed twice in one match keeps one row
+            c.executemany(
+                "INSERT OR REPLACE INTO rating_ledger (match_id, player_id, datetime, "
+                "mu_before, sigma_before, mu_after, sigma_after) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ledger,
+            )
+        profiling.count("snapshot_rows_written", len(rows))
+        profiling.count("ledger_rows_written", len(ledger))
 
 
-def regenerate_all_player_days():
+def regenerate_all_player_days(workers=None):
     """Regenerates player_days for all match dates up to the latest match."""
     if not DBState.matches:
         print("No matches to process.")
         return
 
-    latest_date = max(m.datetime.split("T")[0] for m in DBState.matches)
-    regenerate_player_days_up_to(latest_date)
+    regenerate_player_days_from(workers=workers)
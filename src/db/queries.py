@@ -0,0 +1,130 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Read-only queries that answer straight from SQLite.
+
+Commands that only read (rankings and players list or history) run these on
+a db.storage.read_only() cursor instead of loading DBState, so they never
+build the league's teams and matches, and their cost follows the size of
+the answer rather than the size of the league.
+"""
+
+from db.storage import apply_settings
+
+# Ranking keys as SQL over mu and sigma. The players table has an index on
+# each (see db.migrations), so the current leaderboard is read in order.
+SORT_KEYS = {
+    "mu": "mu",
+    "conservative": "mu - 3 * sigma",
+}
+
+# Every player's rating as of :date. player_days is sparse, so each player's
+# rating is their latest row on or before the date (found through the
+# (player_id, date) unique index), or the default if there is none.
+_RATINGS_ON = """(
+    SELECT p.id, p.name,
+           COALESCE(pd.mu, :mu) AS mu, COALESCE(pd.sigma, :sigma) AS sigma
+    FROM players p
+    LEFT JOIN player_days pd ON pd.player_id = p.id AND pd.date = (
+        SELECT MAX(date) FROM player_days
+        WHERE player_id = p.id AND date <= :date
+    )
+)"""
+
+
+def find_player(c, name):
+    """Resolves a name as cli.util.find_player does, to (id, name) or None.
+
+    An exact match ignores case, and the first player by id wins if two
+    names only differ by case. Otherwise the name is fuzzy-matched against
+    the roster, and the guess is reported.
+    """
+    key = name.casefold()
+    # An index seek; NOCASE folds ASCII only, so casefold has the last word
+    c.execute(
+        "SELECT id, name FROM players WHERE name = ? COLLATE NOCASE ORDER BY id",
+        (name,),
+    )
+    for row in c.fetchall():
+        if row[1].casefold() == key:
+            return row
+
+    from rapidfuzz import process
+
+    rows = c.execute("SELECT id, name FROM players ORDER BY id").fetchall()
+    # Names that only match once folded beyond ASCII (say, "ß" and "ss")
+    for row in rows:
+        if row[1].casefold() == key:
+            return row
+    best = process.extractOne(name, [n for _, n in rows], score_cutoff=80)
+    if not best:
+        return None
+    suggestion, _, index = best
+    print(f"No exact match for '{name}'. Did you mean '{suggestion}'?")
+    return rows[index]
+
+
+def player_names(c):
+    """Yields every player's name in sorted order."""
+    # SQLite compares text as UTF-8 bytes, which sort like Python strings
+    for (name,) in c.execute("SELECT name FROM players ORDER BY name"):
+        yield name
+
+
+def count_players(c):
+    return c.execute("SELECT COUNT(*) FROM players").fetchone()[0]
+
+
+def latest_date(c, date_str=None):
+    """The latest snapshot date, or the latest on or before date_str."""
+    if date_str is None:
+        c.execute("SELECT MAX(date) FROM player_days")
+    else:
+        c.execute("SELECT MAX(date) FROM player_days WHERE date <= ?", (date_str,))
+    return c.fetchone()[0]
+
+
+def _source(c, date_str):
+    """The ratings to rank and their parameters: current, or as of a date."""
+    if date_str is None:
+        return "players", {}
+    # Players without a snapshot yet have the default rating, which depends
+    # on the stored parameters; only this path needs trueskill
+    from trueskill import Rating
+
+    apply_settings(c)
+    default = Rating()
+    return _RATINGS_ON, {"mu": default.mu, "sigma": default.sigma, "date": date_str}
+
+
+def players_ahead(c, player_id, sort="mu", date_str=None):
+    """How many players rank above one; ties are ordered by id.
+
+    Counts rather than ranks everyone: for the current ratings, the two
+    counts are index range scans.
+    """
+    source, params = _source(c, date_str)
+    key = SORT_KEYS[sort]
+    c.execute(f"SELECT {key} FROM {source} WHERE id = :id", {**params, "id": player_id})
+    (value,) = c.fetchone()
+    c.execute(
+        f"""
+        SELECT (SELECT COUNT(*) FROM {source} WHERE {key} > :value)
+             + (SELECT COUNT(*) FROM {source} WHERE {key} = :value AND id < :id)
+        """,
+        {**params, "value": value, "id": player_id},
+    )
+    return c.fetchone()[0]
+
+
+def leaderboard(c, sort="mu", offset=0, limit=None, date_str=None):
+    """Returns a cursor over one page of (name, mu, sigma), best first.
+
+    Without date_str the page is read in index order from players, which
+    holds the current ratings; with it, ratings are as of that date.
+    """
+    source, params = _source(c, date_str)
+    limit = -1 if limit is None else limit
+    return c.execute(
+        f"SELECT name, mu, sigma FROM {source} ORDER BY {SORT_KEYS[sort]} DESC, id "
+        "LIMIT :limit OFFSET :offset",
+        {**params, "limit": limit, "offset": offset},
+    )
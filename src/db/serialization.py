@@ -2,13 +2,76 @@
 
 import os
 import json
-import sqlite3
-from db.storage import DB_PATH, DBState
-from models import Player, Team, Match
+
+from itertools import groupby
+from db import journal
+from db.migrations import dedupe_teams
+from db.storage import (
+    DBState,
+    apply_settings,
+    bump_revision,
+    load_db,
+    read_only,
+    read_settings,
+    reindex,
+    roster_key,
+    save_db,
+    snapshot,
+    transaction,
+    write_lock,
+    write_settings,
+)
+from models import Match, MatchTeam, Player, Team
 from db.player_days import regenerate_all_player_days
 
+FORMATS = ("json", "ndjson")
+
+# Rows buffered per table before an executemany during NDJSON import
+BATCH_SIZE = 10000
+
+
+def detect_format(path):
+    return "ndjson" if path.endswith((".ndjson", ".jsonl")) else "json"
+
+
+def export_db(json_path="league.json", fmt=None):
+    if (fmt or detect_format(json_path)) == "ndjson":
+        export_ndjson(json_path)
+    else:
+        export_json(json_path)
+    print(f"Database exported to {json_path}")
+
+
+def import_db(json_path="league.json", workers=None):
+    if not os.path.exists(json_path):
+        print(f"Error: {json_path} does not exist.")
+        return
+
+    # One transaction: other processes see the old league or the new one
+    with write_lock() as conn:
+        # A file without parameters is replayed under the database's
+        apply_settings(conn.cursor())
+        if is_ndjson(json_path):
+            import_ndjson(json_path, workers)
+        else:
+            import_json(json_path, workers)
+    print(f"Database imported from {json_path}")
+
+
+def export_json(json_path):
+    # One snapshot for the state and the snapshots, so a write committed
+    # meanwhile cannot leave the file half old and half new
+    with snapshot() as c:
+        load_db(c)
+        c.execute(
+            "SELECT player_id, date, mu, sigma FROM player_days ORDER BY date, id"
+        )
+        player_days_data = [
+            {"player_id": pid, "date": date, "mu": mu, "sigma": sigma}
+            for pid, date, mu, sigma in c.fetchall()
+        ]
+        settings = read_settings(c)
 
-def export_db(json_path="league.json"):
     players_data = [
         {"id": p.id, "name": p.name, "mu": p.mu, "sigma": p.sigma} for p in DBState.players
     ]
@@ -18,22 +81,13 @@ def export_db(json_path="league.json"):
             "id": m.id,
             "datetime": m.datetime,
             "match_teams": [
-                {"team_id": mt["team"].id, "place": mt["place"], "score": mt["score"]}
+                {"team_id": mt.team.id, "place": mt.place, "score": mt.score}
                 for mt in m.match_teams
             ],
         }
         for m in DBState.matches
     ]
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT player_id, date, mu, sigma FROM player_days")
-    player_days_data = [
-        {"player_id": pid, "date": date, "mu": mu, "sigma": sigma}
-        for pid, date, mu, sigma in c.fetchall()
-    ]
-    conn.close()
-
     with open(json_path, "w", encoding="utf-8") as f:
         json.dump(
             {
@@ -41,19 +95,15 @@ def export_db(json_path="league.json"):
                 "teams": teams_data,
                 "matches": matches_data,
                 "player_days": player_days_data,
+                "player_days_format": "sparse",
+                "settings": settings,
             },
             f,
             indent=2,
         )
 
-    print(f"Database exported to {json_path}")
-
-
-def import_db(json_path="league.json"):
-    if not os.path.exists(json_path):
-        print(f"Error: {json_path} does not exist.")
-        return
 
+def import_json(json_path, workers=None):
     with open(json_path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
@@ -64,27 +114,224 @@ def import_db(json_path="league.json"):
         id_to_player[p["id"]] = player
         DBState.players.append(player)
 
+    # Files written before teams were shared can repeat a lineup; those
+    # teams collapse into the first one
     id_to_team = {}
+    by_roster = {}
     DBState.teams.clear()
     for t in data["teams"]:
         team_players = [id_to_player[pid] for pid in t["players"]]
-        team = Team(t["id"], players=team_players)
+        key = roster_key(team_players)
+        team = by_roster.get(key)
+        if team is None:
+            team = Team(t["id"], players=team_players)
+            by_roster[key] = team
+            DBState.teams.append(team)
         id_to_team[t["id"]] = team
-        DBState.teams.append(team)
 
     DBState.matches.clear()
     for m in data["matches"]:
         match_teams = []
         for mt in m["match_teams"]:
             match_teams.append(
-                {
-                    "team": id_to_team[mt["team_id"]],
-                    "place": mt["place"],
-                    "score": mt["score"],
-                }
+                MatchTeam(id_to_team[mt["team_id"]], mt["place"], mt["score"])
             )
         match = Match(m["id"], match_teams, datetime=m["datetime"])
         DBState.matches.append(match)
 
-    regenerate_all_player_days()
-    print(f"Database imported from {json_path}")
+    reindex()
+    # Replaces the league rather than changing what was loaded
+    DBState.rows = DBState.revision = None
+    if "settings" in data:
+        with transaction() as c:
+            replace_settings(c, data["settings"])
+
+    # Sparse snapshots can be restored as-is. Older files carry one row per
+    # player per day, so rebuild those into the sparse format instead.
+    if data.get("player_days_format") == "sparse":
+        with transaction() as c:
+            c.execute("DELETE FROM player_days")
+            # Filled by the next replay
+            c.execute("DELETE FROM rating_ledger")
+            c.executemany(
+                "INSERT INTO player_days (player_id, date, mu, sigma) VALUES (?, ?, ?, ?)",
+                (
+                    (pd["player_id"], pd["date"], pd["mu"], pd["sigma"])
+                    for pd in data["player_days"]
+                ),
+            )
+    else:
+        regenerate_all_player_days(workers)
+    save_db()
+
+
+def replace_settings(c, values):
+    """Swaps the stored TrueSkill parameters for an export's and applies them.
+
+    Files written before parameters were stored have none, and keep the
+    database's.
+    """
+    c.execute("DELETE FROM settings")
+    write_settings(c, values)
+    apply_settings(c)
+
+
+def is_ndjson(path):
+    """Tells NDJSON from the indented JSON format by its first line."""
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline().strip()
+    try:
+        record = json.loads(first)
+    except ValueError:
+        return False
+    return isinstance(record, dict) and "type" in record
+
+
+def export_ndjson(path):
+    """Streams the database to one tagged JSON record per line.
+
+    Rows come straight from SQLite cursors, so memory stays flat no matter
+    how large the league is. Every table is read in one snapshot, so a write
+    committed meanwhile cannot leave matches pointing at teams not exported.
+    """
+    with read_only() as c, open(path, "w", encoding="utf-8") as f:
+        write = f.write
+        dumps = json.dumps
+        header = {
+            "type": "header",
+            "player_days_format": "sparse",
+            "settings": read_settings(c),
+        }
+        write(dumps(header) + "\n")
+
+        c.execute("SELECT id, name, mu, sigma FROM players ORDER BY id")
+        for pid, name, mu, sigma in c:
+            record = {"type": "player", "id": pid, "name": name}
+            record.update(mu=mu, sigma=sigma)
+            write(dumps(record) + "\n")
+
+        c.execute(
+            """
+            SELECT t.id, tp.player_id
+            FROM teams t LEFT JOIN team_players tp ON tp.team_id = t.id
+            ORDER BY t.id, tp.id
+            """
+        )
+        for team_id, rows in groupby(c, key=lambda row: row[0]):
+            players = [pid for _, pid in rows if pid is not None]
+            write(dumps({"type": "team", "id": team_id, "players": players}) + "\n")
+
+        c.execute(
+            """
+            SELECT m.id, m.datetime, mt.team_id, mt.place, mt.score
+            FROM matches m LEFT JOIN match_teams mt ON mt.match_id = m.id
+            ORDER BY m.id, mt.id
+            """
+        )
+        for (match_id, match_datetime), rows in groupby(c, key=lambda row: row[:2]):
+            match_teams = [
+                {"team_id": team_id, "place": place, "score": score}
+                for _, _, team_id, place, score in rows
+                if team_id is not None
+            ]
+            record = {
+                "type": "match",
+                "id": match_id,
+                "datetime": match_datetime,
+                "match_teams": match_teams,
+            }
+            write(dumps(record) + "\n")
+
+        c.execute(
+            "SELECT player_id, date, mu, sigma FROM player_days ORDER BY date, id"
+        )
+        for pid, date, mu, sigma in c:
+            record = {
+                "type": "player_day",
+                "player_id": pid,
+                "date": date,
+                "mu": mu,
+                "sigma": sigma,
+            }
+            write(dumps(record) + "\n")
+
+
+def import_ndjson(path, workers=None):
+    """Streams an NDJSON export into the database in batched inserts.
+
+    Snapshots in the file are restored as-is; if there are none, the state
+    is loaded afterwards to replay the history.
+    """
+    statements = {
+        "player": "INSERT INTO players (id, name, mu, sigma) VALUES (?, ?, ?, ?)",
+        "team": "INSERT INTO teams (id) VALUES (?)",
+        "team_player": "INSERT INTO team_players (team_id, player_id) VALUES (?, ?)",
+        "match": "INSERT INTO matches (id, datetime) VALUES (?, ?)",
+        "match_team": "INSERT INTO match_teams (match_id, team_id, place, score) "
+        "VALUES (?, ?, ?, ?)",
+        "player_day": "INSERT INTO player_days (player_id, date, mu, sigma) "
+        "VALUES (?, ?, ?, ?)",
+    }
+    buffers = {kind: [] for kind in statements}
+    has_player_days = False
+
+    def add(kind, row):
+        buffer = buffers[kind]
+        buffer.append(row)
+        if len(buffer) >= BATCH_SIZE:
+            c.executemany(statements[kind], buffer)
+            buffer.clear()
+
+    with transaction() as c, open(path, "r", encoding="utf-8") as f:
+        for table in (
+            "players",
+            "teams",
+            "team_players",
+            "matches",
+            "match_teams",
+            "player_days",
+            "rating_ledger",
+        ):
+            c.execute(f"DELETE FROM {table}")
+        journal.clear(c)
+        bump_revision(c)
+
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record["type"]
+            if kind == "header":
+                if "settings" in record:
+                    replace_settings(c, record["settings"])
+            elif kind == "player":
+                row = (record["id"], record["name"], record["mu"], record["sigma"])
+                add("player", row)
+            elif kind == "team":
+                add("team", (record["id"],))
+                for pid in record["players"]:
+                    add("team_player", (record["id"], pid))
+            elif kind == "match":
+                add("match", (record["id"], record["datetime"]))
+                for mt in record["match_teams"]:
+                    add(
+                        "match_team",
+                        (record["id"], mt["team_id"], mt["place"], mt["score"]),
+                    )
+            elif kind == "player_day":
+                has_player_days = True
+                row = (record["player_id"], record["date"])
+                add("player_day", (*row, record["mu"], record["sigma"]))
+
+        for kind, buffer in buffers.items():
+            c.executemany(statements[kind], buffer)
+        dedupe_teams(c)
+
+    if not has_player_days:
+        load_db()
+        regenerate_all_player_days(workers)
+        with transaction() as c:
+            c.executemany(
+                "UPDATE players SET mu = ?, sigma = ? WHERE id = ?",
+                ((p.mu, p.sigma, p.id) for p in DBState.players),
+            )
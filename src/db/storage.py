@@ -1,18 +1,65 @@
 # SPDX-License-Identifier: GPL-3.0-or-later
 
 import os
-import shutil
 import sqlite3
 import sys
-from models import Player, Team, Match
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import columnar
+import profiling
+from db import journal
+from db.migrations import migrate
+
+# models and ratings import trueskill, so they are imported where the state
+# is built or rated; read-only commands never need them
 
 DB_PATH = "league.db"
+# Page cache per connection, in KiB (negative values are sizes, not pages)
+CACHE_SIZE = -32768
+# Seconds a connection waits for another process's write lock before failing
+BUSY_TIMEOUT = 30.0
+# save_db copies the database here at most once per BACKUP_INTERVAL seconds;
+# a copy costs time in proportion to the database, not to the change saved
+BACKUP_PATH = "league_backup.db"
+BACKUP_INTERVAL = 600.0
+
+# The connection holding the write lock while write_lock() is open
+_write_conn = None
+
+
+class ConflictError(Exception):
+    """Another process saved changes since the state was loaded."""
 
 
 class DBState:
     players = []
     teams = []
     matches = []
+    players_by_id = {}
+    teams_by_id = {}
+    matches_by_id = {}
+    # Case-folded name -> Player, for resolving names typed on the command line
+    players_by_name = {}
+    # (names, players) choices for fuzzy matching, built on the first miss and
+    # reset to None whenever the roster changes
+    name_choices = None
+    # Sorted player-id tuple -> Team, so a recurring lineup reuses one team row
+    teams_by_roster = {}
+    # Next free id per table
+    next_ids = {"players": 1, "teams": 1, "matches": 1}
+    # Row images keyed by id as of the last load/save. None means the state
+    # was not loaded from the database, so the next save rewrites every table.
+    rows = None
+    # Ids per table created, changed or deleted since the last load/save (see
+    # mark_dirty); save_db images and writes only these
+    dirty = {"players": set(), "teams": set(), "matches": set()}
+    # Whether the load dropped team or match rows pointing at deleted rows,
+    # which the next save then deletes
+    orphans = False
+    # The database revision the state was loaded at, or None if it was not
+    # loaded (or a failed write may have left it out of step)
+    revision = None
 
 
 def set_db_path(path):
@@ -20,91 +67,617 @@ def set_db_path(path):
     DB_PATH = path
 
 
+def set_busy_timeout(seconds):
+    global BUSY_TIMEOUT
+    BUSY_TIMEOUT = max(seconds, 0)
+
+
+def set_backup_interval(seconds):
+    global BACKUP_INTERVAL
+    BACKUP_INTERVAL = max(seconds, 0)
+
+
 def resource_path(filename):
     base = getattr(sys, "_MEIPASS", os.path.abspath("."))
     return os.path.join(base, filename)
 
 
-def init_db():
-    if not os.path.exists(DB_PATH):
-        with open(resource_path("schemas.sql")) as f:
-            sql = f.read()
-        conn = sqlite3.connect(DB_PATH)
-        conn.executescript(sql)
+def connect():
+    conn = sqlite3.connect(
+        DB_PATH, timeout=BUSY_TIMEOUT, factory=profiling.connection_class()
+    )
+    # With WAL this cannot corrupt the database; a power cut may lose the
+    # latest commits, in exchange for no fsync per commit
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+    return conn
+
+
+def connect_readonly():
+    """Opens the database with a mode=ro URI, for commands that only read.
+
+    Nothing can be written through it, so it needs no backup; with WAL it
+    still sees every committed write.
+    """
+    uri = f"{Path(DB_PATH).absolute().as_uri()}?mode=ro"
+    conn = sqlite3.connect(
+        uri, uri=True, timeout=BUSY_TIMEOUT, factory=profiling.connection_class()
+    )
+    conn.execute(f"PRAGMA cache_size = {CACHE_SIZE}")
+    return conn
+
+
+def backup_due(path=BACKUP_PATH):
+    """Whether the backup at path is missing or BACKUP_INTERVAL old."""
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return True
+    return age >= BACKUP_INTERVAL
+
+
+@profiling.timed("backup")
+def backup_db(path=BACKUP_PATH):
+    """Copies the committed database, including pages still in the WAL.
+
+    save_db runs this under the write lock when a backup is due, so
+    concurrent saves take turns and each backup holds the state from just
+    before a save.
+    """
+    source = connect()
+    target = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+@contextmanager
+def write_lock():
+    """Yields a connection holding the database write lock until exit.
+
+    The lock is taken up front with BEGIN IMMEDIATE, waiting up to
+    BUSY_TIMEOUT for other writers; a deferred transaction that reads first
+    cannot wait, and fails instead if another process commits meanwhile.
+    Everything is committed on exit, or rolled back on an exception. Nested
+    calls share the connection and roll back to a savepoint on an exception,
+    so a failed step leaves the rest of the outer transaction intact.
+    """
+    global _write_conn
+    if _write_conn is not None:
+        conn = _write_conn
+        conn.execute("SAVEPOINT nested")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK TO nested")
+            DBState.revision = None
+            raise
+        finally:
+            conn.execute("RELEASE nested")
+        return
+
+    conn = connect()
+    try:
+        with profiling.span("lock_wait"):
+            conn.execute("BEGIN IMMEDIATE")
+        _write_conn = conn
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            DBState.revision = None
+            raise
         conn.commit()
+    finally:
+        _write_conn = None
+        conn.close()
+
+
+@contextmanager
+def transaction(conn=None):
+    """Yields a cursor inside one write transaction.
+
+    Without a connection, this is write_lock(). A connection passed in is
+    left for the caller to commit, so several writes can share one
+    transaction.
+    """
+    if conn is not None:
+        yield conn.cursor()
+        return
+    with write_lock() as conn:
+        yield conn.cursor()
+
+
+@contextmanager
+def snapshot():
+    """Yields a cursor whose reads all see one committed state.
+
+    Inside write_lock() it reads through the lock's connection instead, so
+    it sees the writes made so far.
+    """
+    if _write_conn is not None:
+        yield _write_conn.cursor()
+        return
+    conn = connect()
+    try:
+        conn.execute("BEGIN")
+        yield conn.cursor()
+    finally:
+        conn.close()
+
+
+@contextmanager
+def read_only():
+    """Yields a read-only cursor whose reads all see one committed state.
+
+    Unlike snapshot(), it never joins the write lock's transaction; queries
+    run through it stream rows without building DBState (see db.queries).
+    """
+    conn = connect_readonly()
+    try:
+        conn.execute("BEGIN")
+        yield conn.cursor()
+    finally:
         conn.close()
 
 
-def load_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def read_revision(c):
+    return c.execute("SELECT value FROM revision").fetchone()[0]
+
+
+def bump_revision(c):
+    c.execute("UPDATE revision SET value = value + 1")
+
+
+def check_revision(c):
+    """Raises ConflictError if the database moved on since load_db()."""
+    if DBState.revision is not None and read_revision(c) != DBState.revision:
+        raise ConflictError(
+            "The league was changed by another process since it was loaded; "
+            "nothing was saved. Run the command again."
+        )
+
+
+def is_current():
+    """Whether the loaded state is still the latest saved revision."""
+    if DBState.revision is None:
+        return False
+    with snapshot() as c:
+        return read_revision(c) == DBState.revision
+
+
+def init_db():
+    """Creates the database if needed and upgrades it to the current schema."""
+    created = not os.path.exists(DB_PATH)
+    conn = connect()
+    if created:
+        with open(resource_path("schemas.sql")) as f:
+            conn.executescript(f.read())
+    # Stored in the file: readers no longer wait for a writer to commit
+    if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+        conn.execute("PRAGMA journal_mode = WAL")
+    migrate(conn)
+    conn.close()
+
+
+def read_settings(c):
+    """The stored TrueSkill parameters, by name."""
+    return dict(c.execute("SELECT name, value FROM settings"))
+
+
+def write_settings(c, values):
+    """Stores TrueSkill parameters; they take effect on the next load."""
+    c.executemany(
+        "INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)",
+        values.items(),
+    )
+
+
+def apply_settings(c):
+    """Sets up the rating environment from the stored parameters.
+
+    Every load runs this. Commands that rate or default ratings without
+    loading the state (import, dated rankings) run it themselves.
+    """
+    import ratings
+
+    ratings.set_parameters(read_settings(c))
+
+
+def reindex():
+    """Rebuilds the id lookup maps from the DBState lists."""
+    DBState.players_by_id = {p.id: p for p in DBState.players}
+    DBState.teams_by_id = {t.id: t for t in DBState.teams}
+    DBState.matches_by_id = {m.id: m for m in DBState.matches}
+    DBState.players_by_name = {}
+    for p in DBState.players:
+        # The first player wins if two names only differ by case
+        DBState.players_by_name.setdefault(p.name.casefold(), p)
+    DBState.name_choices = None
+    index_rosters()
+    DBState.next_ids = {
+        "players": max(DBState.players_by_id, default=0) + 1,
+        "teams": max(DBState.teams_by_id, default=0) + 1,
+        "matches": max(DBState.matches_by_id, default=0) + 1,
+    }
+    columnar.invalidate()
+
+
+def index_rosters():
+    """Rebuilds DBState.teams_by_roster once team members are in place."""
+    DBState.teams_by_roster = {}
+    for t in DBState.teams:
+        DBState.teams_by_roster.setdefault(roster_key(t.players), t)
+
+
+def next_id(table):
+    """Allocates the next id for players, teams or matches.
+
+    Ids of deleted rows are never reused (see _load).
+    """
+    new_id = DBState.next_ids[table]
+    DBState.next_ids[table] = new_id + 1
+    return new_id
+
+
+def mark_dirty(table, obj_id):
+    """Notes that a player, team or match was created, changed or deleted.
+
+    save_db compares only marked rows with their saved images, so anything
+    that changes the state without marking it is not saved.
+    """
+    DBState.dirty[table].add(obj_id)
+
+
+def clear_dirty():
+    for ids in DBState.dirty.values():
+        ids.clear()
+
+
+def roster_key(players):
+    return tuple(sorted(p.id for p in players))
+
+
+def intern_team(players):
+    """Returns the team with exactly these players, creating it if needed."""
+    from models import Team
+
+    key = roster_key(players)
+    team = DBState.teams_by_roster.get(key)
+    if team is None:
+        team = Team(id=next_id("teams"), players=list(players))
+        DBState.teams.append(team)
+        DBState.teams_by_id[team.id] = team
+        DBState.teams_by_roster[key] = team
+        mark_dirty("teams", team.id)
+    return team
+
+
+def add_to_roster(player):
+    DBState.players.append(player)
+    DBState.players_by_id[player.id] = player
+    DBState.players_by_name.setdefault(player.name.casefold(), player)
+    DBState.name_choices = None
+    mark_dirty("players", player.id)
+    columnar.invalidate()
+
+
+def remove_from_roster(player):
+    DBState.players.remove(player)
+    DBState.players_by_id.pop(player.id, None)
+    mark_dirty("players", player.id)
+    key = player.name.casefold()
+    if DBState.players_by_name.get(key) is player:
+        del DBState.players_by_name[key]
+        # Another player may share the name up to case
+        for p in DBState.players:
+            if p.name.casefold() == key:
+                DBState.players_by_name[key] = p
+                break
+    DBState.name_choices = None
+    columnar.invalidate()
+
+
+def add_to_history(match):
+    DBState.matches.append(match)
+    DBState.matches_by_id[match.id] = match
+    mark_dirty("matches", match.id)
+
+
+def remove_from_history(match):
+    DBState.matches.remove(match)
+    DBState.matches_by_id.pop(match.id, None)
+    mark_dirty("matches", match.id)
+
+
+@profiling.timed("load_db")
+def load_db(c=None):
+    """Loads the league into DBState from one committed state.
+
+    Pass a snapshot() cursor to load inside the caller's snapshot, so the
+    caller's later reads on it see the same state.
+    """
+    if c is None:
+        with snapshot() as c:
+            _load(c)
+    else:
+        _load(c)
+    DBState.rows = snapshot_rows()
+    clear_dirty()
+    if profiling.MODE is not None:
+        profiling.count("rows_read", sum(len(rows) for rows in DBState.rows.values()))
+        profiling.count("rows_read", sum(len(t.players) for t in DBState.teams))
+        profiling.count("rows_read", sum(len(m.match_teams) for m in DBState.matches))
+
+
+def _load(c):
+    from models import Match, MatchTeam, Player, Team
+
+    DBState.revision = read_revision(c)
+    # Another process may have tuned the parameters since the last load
+    apply_settings(c)
 
     DBState.players.clear()
     c.execute("SELECT id, name, mu, sigma FROM players")
-    DBState.players.extend(Player(*row) for row in c.fetchall())
+    DBState.players.extend(Player(*row) for row in c)
 
     DBState.teams.clear()
     c.execute("SELECT id FROM teams")
-    DBState.teams.extend(Team(row[0]) for row in c.fetchall())
-
-    c.execute("SELECT team_id, player_id FROM team_players")
-    for team_id, player_id in c.fetchall():
-        team = next(t for t in DBState.teams if t.id == team_id)
-        player = next(p for p in DBState.players if p.id == player_id)
-        team.players.append(player)
+    DBState.teams.extend(Team(row[0]) for row in c)
 
     DBState.matches.clear()
     c.execute("SELECT id, datetime FROM matches")
-    DBState.matches.extend(Match(id=row[0], datetime=row[1]) for row in c.fetchall())
+    DBState.matches.extend(Match(id=row[0], datetime=row[1]) for row in c)
 
-    c.execute("SELECT match_id, team_id, place, score FROM match_teams")
-    for match_id, team_id, place, score in c.fetchall():
-        match = next(m for m in DBState.matches if m.id == match_id)
-        team = next(t for t in DBState.teams if t.id == team_id)
-        match.match_teams.append({"team": team, "place": place, "score": score})
+    reindex()
+    # Snapshots, ledger rows and team rows can outlive a deleted player or
+    # match, so its id must not be handed out again. The AUTOINCREMENT
+    # tables record the highest id ever used, deleted or not.
+    c.execute(
+        "SELECT name, seq FROM sqlite_sequence "
+        "WHERE name IN ('players', 'teams', 'matches')"
+    )
+    for table, seq in c:
+        DBState.next_ids[table] = max(DBState.next_ids[table], seq + 1)
+    players_by_id = DBState.players_by_id
+    teams_by_id = DBState.teams_by_id
+    matches_by_id = DBState.matches_by_id
 
-    conn.close()
+    # Rows pointing at deleted players, teams or matches are dropped here and
+    # deleted from the tables by the next save (see delete_orphans). Dirty
+    # rows alone would never reach them, since they are not in the state.
+    DBState.orphans = False
+    c.execute("SELECT team_id, player_id FROM team_players ORDER BY id")
+    for team_id, player_id in c:
+        team = teams_by_id.get(team_id)
+        player = players_by_id.get(player_id)
+        if team is not None and player is not None:
+            team.players.append(player)
+        else:
+            DBState.orphans = True
+    index_rosters()
 
+    c.execute("SELECT match_id, team_id, place, score FROM match_teams ORDER BY id")
+    for match_id, team_id, place, score in c:
+        match = matches_by_id.get(match_id)
+        team = teams_by_id.get(team_id)
+        if match is not None and team is not None:
+            match.match_teams.append(MatchTeam(team, place, score))
+        else:
+            DBState.orphans = True
 
-def save_db():
-    if os.path.exists(DB_PATH):
-        shutil.copy(DB_PATH, "league_backup.db")
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+def delete_orphans(c):
+    """Deletes team and match rows that point at deleted rows."""
+    c.execute(
+        "DELETE FROM team_players WHERE team_id NOT IN (SELECT id FROM teams) "
+        "OR player_id NOT IN (SELECT id FROM players)"
+    )
+    c.execute(
+        "DELETE FROM match_teams WHERE match_id NOT IN (SELECT id FROM matches) "
+        "OR team_id NOT IN (SELECT id FROM teams)"
+    )
 
-    c.execute("DELETE FROM players")
-    for p in DBState.players:
-        c.execute(
-            "INSERT INTO players (id, name, mu, sigma) VALUES (?, ?, ?, ?)",
-            (p.id, p.name, p.mu, p.sigma),
-        )
 
-    c.execute("DELETE FROM teams")
-    for t in DBState.teams:
-        c.execute("INSERT INTO teams (id) VALUES (?)", (t.id,))
+def snapshot_rows():
+    """Returns the row images of the current in-memory state, keyed by id."""
+    return {
+        "players": {p.id: player_row(p) for p in DBState.players},
+        "teams": {t.id: team_row(t) for t in DBState.teams},
+        "matches": {m.id: match_row(m) for m in DBState.matches},
+    }
 
-    c.execute("DELETE FROM team_players")
-    for t in DBState.teams:
-        for p in t.players:
-            c.execute(
-                "INSERT INTO team_players (team_id, player_id) VALUES (?, ?)",
-                (t.id, p.id),
-            )
-
-    c.execute("DELETE FROM matches")
-    for m in DBState.matches:
-        c.execute(
-            "INSERT INTO matches (id, datetime) VALUES (?, ?)", (m.id, m.datetime)
-        )
 
-    c.execute("DELETE FROM match_teams")
-    for m in DBState.matches:
-        for mt in m.match_teams:
-            c.execute(
-                "INSERT INTO match_teams (match_id, team_id, place, score) VALUES (?, ?, ?, ?)",
-                (m.id, mt["team"].id, mt["place"], mt["score"]),
-            )
+def dirty_rows():
+    """Returns (before, after) images of the rows marked dirty, keyed by id.
+
+    before holds the saved images and after the current ones; a row missing
+    from before is new, and one missing from after was deleted.
+    """
+    images = {
+        "players": (DBState.players_by_id, player_row),
+        "teams": (DBState.teams_by_id, team_row),
+        "matches": (DBState.matches_by_id, match_row),
+    }
+    before = {}
+    after = {}
+    for table, ids in DBState.dirty.items():
+        saved = DBState.rows[table]
+        by_id, row = images[table]
+        before[table] = {k: saved[k] for k in ids if k in saved}
+        after[table] = {k: row(by_id[k]) for k in ids if k in by_id}
+    return before, after
+
+
+def player_row(player):
+    return (player.name, player.mu, player.sigma)
+
+
+def team_row(team):
+    return tuple(p.id for p in team.players)
+
+
+def match_row(match):
+    """A flat row image: the datetime, then team id, place and score per team.
+
+    One tuple per match keeps the snapshot held between saves small.
+    """
+    row = [match.datetime]
+    for mt in match.match_teams:
+        row += (mt.team.id, mt.place, mt.score)
+    return tuple(row)
+
+
+def diff_rows(before, after):
+    """Splits two id-keyed row images into inserted, updated and deleted ids."""
+    inserted = [k for k in after if k not in before]
+    updated = [k for k in after if k in before and after[k] != before[k]]
+    deleted = [k for k in before if k not in after]
+    return inserted, updated, deleted
+
+
+def _executemany(c, sql, rows):
+    c.executemany(sql, rows)
+    profiling.count("rows_written", max(c.rowcount, 0))
+
+
+def write_changes(c, before, after):
+    """Writes only the rows that differ between two snapshot_rows() images."""
+    players_before, players_after = before["players"], after["players"]
+    inserted, updated, deleted = diff_rows(players_before, players_after)
+    _executemany(c, "DELETE FROM players WHERE id = ?", [(k,) for k in deleted])
+    _executemany(
+        c,
+        "UPDATE players SET name = ?, mu = ?, sigma = ? WHERE id = ?",
+        [(*players_after[k], k) for k in updated],
+    )
+    _executemany(
+        c,
+        "INSERT INTO players (id, name, mu, sigma) VALUES (?, ?, ?, ?)",
+        [(k, *players_after[k]) for k in inserted],
+    )
+
+    teams_before, teams_after = before["teams"], after["teams"]
+    inserted, updated, deleted = diff_rows(teams_before, teams_after)
+    _executemany(c, "DELETE FROM teams WHERE id = ?", [(k,) for k in deleted])
+    _executemany(
+        c,
+        "DELETE FROM team_players WHERE team_id = ?",
+        [(k,) for k in deleted + updated],
+    )
+    _executemany(c, "INSERT INTO teams (id) VALUES (?)", [(k,) for k in inserted])
+    _executemany(
+        c,
+        "INSERT INTO team_players (team_id, player_id) VALUES (?, ?)",
+        [(k, pid) for k in updated + inserted for pid in teams_after[k]],
+    )
+
+    matches_before, matches_after = before["matches"], after["matches"]
+    inserted, updated, deleted = diff_rows(matches_before, matches_after)
+    _executemany(c, "DELETE FROM matches WHERE id = ?", [(k,) for k in deleted])
+    _executemany(
+        c,
+        "DELETE FROM match_teams WHERE match_id = ?",
+        [(k,) for k in deleted + updated],
+    )
+    _executemany(
+        c,
+        "UPDATE matches SET datetime = ? WHERE id = ?",
+        [(matches_after[k][0], k) for k in updated],
+    )
+    _executemany(
+        c,
+        "INSERT INTO matches (id, datetime) VALUES (?, ?)",
+        [(k, matches_after[k][0]) for k in inserted],
+    )
+    _executemany(
+        c,
+        "INSERT INTO match_teams (match_id, team_id, place, score) VALUES (?, ?, ?, ?)",
+        [
+            (k, *row[i : i + 3])
+            for k in updated + inserted
+            for row in (matches_after[k],)
+            for i in range(1, len(row), 3)
+        ],
+    )
+
+
+def changed_rows(before, after):
+    """Returns [id, before, after] for each changed row, per table.
+
+    A missing row (insert or delete) has None as its image.
+    """
+    changes = {}
+    for table in after:
+        b, a = before[table], after[table]
+        inserted, updated, deleted = diff_rows(b, a)
+        changes[table] = [[k, b.get(k), a.get(k)] for k in inserted + updated + deleted]
+    return changes
+
+
+def apply_changes(c, changes, reverse=False):
+    """Writes a changed_rows() set forwards, or back to its before-images."""
+    before = {table: {} for table in changes}
+    after = {table: {} for table in changes}
+    for table, rows in changes.items():
+        for k, old, new in rows:
+            if reverse:
+                old, new = new, old
+            if old is not None:
+                before[table][k] = old
+            if new is not None:
+                after[table][k] = new
+    write_changes(c, before, after)
+
+
+@profiling.timed("save_db")
+def save_db(label=None, conn=None):
+    """Writes the state's changes since load_db() as one undoable operation.
+
+    Only rows marked with mark_dirty() are compared and written, so the cost
+    follows the size of the change rather than the league. Raises
+    ConflictError, without writing anything, if another process saved in
+    the meantime.
+    """
+    with profiling.span("snapshot"):
+        if DBState.rows is None:
+            before, after = None, snapshot_rows()
+        else:
+            before, after = dirty_rows()
+
+    with transaction(conn) as c:
+        check_revision(c)
+        if backup_due():
+            backup_db()
+        with profiling.span("write"):
+            # Before the changes are written, so it sees only the loaded rows
+            if DBState.orphans and before is not None:
+                delete_orphans(c)
+            _write_state(c, before, after, label)
+            bump_revision(c)
+        revision = read_revision(c)
+
+    if before is None:
+        DBState.rows = after
+    else:
+        for table, rows in DBState.rows.items():
+            for k in before[table]:
+                rows.pop(k)
+            rows.update(after[table])
+    clear_dirty()
+    DBState.orphans = False
+    DBState.revision = revision
+
 
-    conn.commit()
-    conn.close()
\ No newline at end of file
+def _write_state(c, before, after, label):
+    if before is None:
+        # Nothing was loaded to diff against: replace every table
+        for table in ("players", "teams", "team_players", "matches", "match_teams"):
+            c.execute(f"DELETE FROM {table}")
+        before = {"players": {}, "teams": {}, "matches": {}}
+        journal.clear(c)
+    else:
+        journal.record(c, changed_rows(before, after), label)
+    write_changes(c, before, after)
@@ -18,8 +18,8 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
-from cli.dispatch import run_cli
-from db.storage import init_db, set_db_path
+import sys
+from cli.client import forward
 
 VERSION = "v1.4.3"
 
@@ -34,24 +34,90 @@ def main():
         default="league.db",
         help="Path to database file (default: league.db)",
     )
+    parser.add_argument(
+        "--rating-backend",
+        choices=["trueskill", "fast"],
+        default="trueskill",
+        help="Rating engine: reference trueskill factor graph or closed-form fast "
+        "path for 1v1/two-team matches (default: trueskill)",
+    )
+    parser.add_argument(
+        "--undo-depth",
+        type=int,
+        default=20,
+        help="Number of operations kept for undo/redo (default: 20)",
+    )
+    parser.add_argument(
+        "--busy-timeout",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="How long to wait for another process's write to finish (default: 30)",
+    )
+    parser.add_argument(
+        "--backup-interval",
+        type=float,
+        default=600.0,
+        metavar="SECONDS",
+        help="Back up to league_backup.db before a save if the last backup is this "
+        "old; 0 backs up before every save (default: 600)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_const",
+        const="text",
+        help="Print phase timings and counters to stderr (or set "
+        "TRUESKILL_PROFILE=text|json)",
+    )
+    parser.add_argument(
+        "--profile-format",
+        choices=["text", "json"],
+        help="Profile as a summary or as one JSON line (implies --profile)",
+    )
+    parser.add_argument(
+        "--profile-dump",
+        metavar="FILE",
+        help="Also write cProfile stats to FILE (or TRUESKILL_PROFILE_DUMP)",
+    )
     sub = parser.add_subparsers(dest="cmd", help="Primary commands")
 
     # players
     players_parser = sub.add_parser("players", help="Manage players")
     players_parser.add_argument(
         "action",
-        choices=["list", "add", "delete"],
+        choices=["list", "add", "delete", "history"],
         nargs="?",
         default="list",
         help="Action to perform",
     )
     players_parser.add_argument("name", nargs="?", help="Player name(s)")
+    players_parser.add_argument(
+        "--from", dest="from_date", help="history: first date (YYYY-MM-DD)"
+    )
+    players_parser.add_argument(
+        "--to", dest="to_date", help="history: last date (YYYY-MM-DD)"
+    )
 
     # rankings
     rankings_parser = sub.add_parser("rankings", help="Show current player rankings")
     rankings_parser.add_argument(
         "--date", help="Show rankings snapshot for specific date (YYYY-MM-DD)"
     )
+    rankings_parser.add_argument(
+        "--top", type=int, metavar="N", help="Show only the first N players"
+    )
+    rankings_parser.add_argument(
+        "--offset", type=int, default=0, metavar="N", help="Skip the first N players"
+    )
+    rankings_parser.add_argument(
+        "--player", metavar="NAME", help="Show a player's rank and neighbours"
+    )
+    rankings_parser.add_argument(
+        "--sort",
+        choices=["mu", "conservative"],
+        default="mu",
+        help="Rank by μ or by the conservative estimate μ-3σ (default: mu)",
+    )
 
     # matches
     matches_parser = sub.add_parser("matches", help="Manage matches")
@@ -73,13 +139,127 @@ def main():
     matches_parser.add_argument(
         "--scores", help="Comma-separated numeric scores for each team (e.g. 20,15,10)"
     )
+    matches_parser.add_argument(
+        "--deltas",
+        action="store_true",
+        help="list: show each player's change in μ from the match",
+    )
+    matches_parser.add_argument(
+        "--from", dest="from_date", help="list: first date (YYYY-MM-DD)"
+    )
+    matches_parser.add_argument(
+        "--to", dest="to_date", help="list: last date (YYYY-MM-DD)"
+    )
+
+    # matchmake
+    matchmake_parser = sub.add_parser(
+        "matchmake", help="Suggest balanced games among the players present"
+    )
+    matchmake_parser.add_argument(
+        "names", help="Comma-separated names of the players present"
+    )
+    matchmake_parser.add_argument(
+        "--team-size",
+        type=int,
+        default=1,
+        metavar="K",
+        help="Players per team, for K-vs-K games (default: 1)",
+    )
+
+    # simulate
+    simulate_parser = sub.add_parser(
+        "simulate",
+        help="Estimate finishing ranks after a schedule of future matches",
+    )
+    simulate_parser.add_argument(
+        "path",
+        nargs="?",
+        default="-",
+        help="File with one match per line, as for matches add (default: - for "
+        "stdin)",
+    )
+    simulate_parser.add_argument(
+        "--trials",
+        type=int,
+        default=100000,
+        help="Number of simulated seasons (default: 100000)",
+    )
+    simulate_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes for running trials (default: CPU count)",
+    )
+    simulate_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed; the same seed gives the same results (default: 0)",
+    )
+    simulate_parser.add_argument(
+        "--top",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Report each player's chance of finishing in the top N (default: 1)",
+    )
+    simulate_parser.add_argument(
+        "--sort",
+        choices=["mu", "conservative"],
+        default="mu",
+        help="Rank by μ or by the conservative estimate μ-3σ (default: mu)",
+    )
 
-    # undo
+    # tune
+    tune_parser = sub.add_parser(
+        "tune",
+        help="Fit TrueSkill parameters by replaying the match history under "
+        "candidate environments",
+    )
+    for name, default in (
+        ("mu", "the current mu"),
+        ("sigma", "0.5x to 1.5x trueskill's"),
+        ("beta", "0.5x to 2x trueskill's"),
+        ("tau", "0x to 4x trueskill's"),
+        ("draw-probability", "0, 0.05, 0.1"),
+    ):
+        tune_parser.add_argument(
+            f"--{name}",
+            metavar="VALUES",
+            help=f"Comma-separated candidate values (default: {default})",
+        )
+    tune_parser.add_argument(
+        "--metric",
+        choices=["log-loss", "accuracy"],
+        default="log-loss",
+        help="Rank environments by predictive log-loss or accuracy "
+        "(default: log-loss)",
+    )
+    tune_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes for replaying history (default: CPU count)",
+    )
+    tune_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Number of environments to show (default: 10)",
+    )
+    tune_parser.add_argument(
+        "--save",
+        action="store_true",
+        help="Store the best parameters and replay all ratings under them",
+    )
+
+    # undo/redo
     sub.add_parser("undo", help="Undo last operation")
+    sub.add_parser("redo", help="Redo last undone operation")
 
     # import/export
     import_parser = sub.add_parser(
-        "import", help="Import database from JSON (regenerates player_days if missing)"
+        "import",
+        help="Import database from JSON or NDJSON (regenerates player_days if missing)",
     )
     import_parser.add_argument(
         "path",
@@ -87,6 +267,11 @@ def main():
         default="league.json",
         help="Path to JSON file (default: league.json)",
     )
+    import_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes for replaying history (default: CPU count)",
+    )
 
     export_parser = sub.add_parser(
         "export", help="Export database to JSON (includes player_days if available)"
@@ -97,22 +282,85 @@ def main():
         default="league.json",
         help="Path to export JSON file (default: league.json)",
     )
+    export_parser.add_argument(
+        "--format",
+        choices=["json", "ndjson"],
+        help="json, or streamed line-delimited ndjson for large leagues "
+        "(default: ndjson for .ndjson/.jsonl paths, otherwise json)",
+    )
 
     # rebuild snapshots
-    sub.add_parser(
+    rebuild_parser = sub.add_parser(
         "rebuild-snapshots", help="Regenerate player_days for all unique match dates"
     )
+    rebuild_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Processes for replaying history (default: CPU count)",
+    )
 
-    args = parser.parse_args()
+    # batch
+    batch_parser = sub.add_parser(
+        "batch",
+        help="Run players/matches add and delete commands from a file in one "
+        "transaction",
+    )
+    batch_parser.add_argument(
+        "path",
+        nargs="?",
+        default="-",
+        help="File with one command per line (default: - for stdin)",
+    )
 
-    set_db_path(args.db_path)
-    init_db()
+    # daemon
+    sub.add_parser(
+        "serve",
+        help="Keep the database loaded and answer commands over a Unix socket "
+        "(other invocations forward to it automatically)",
+    )
+
+    args = parser.parse_args()
 
     if args.cmd is None or args.cmd == "help":
         parser.print_help()
-    else:
-        run_cli(args)
+        return
+    # A profiled command runs here rather than in the daemon, so its
+    # timings are the ones reported
+    profile = args.profile_format or args.profile
+    if not (profile or args.profile_dump) and forward(args):
+        return
+
+    # Deferred so --version, help and forwarded commands skip these imports
+    import profiling
+
+    profiling.configure(profile, args.profile_dump)
+
+    from cli.dispatch import run_cli
+    from db.journal import set_depth
+    from db.storage import (
+        init_db,
+        set_backup_interval,
+        set_busy_timeout,
+        set_db_path,
+    )
+
+    set_db_path(args.db_path)
+    set_busy_timeout(args.busy_timeout)
+    set_backup_interval(args.backup_interval)
+    if args.rating_backend != "trueskill":
+        from ratings import set_backend
+
+        set_backend(args.rating_backend)
+    set_depth(args.undo_depth)
+    with profiling.span("init_db"):
+        init_db()
+    run_cli(args)
+    profiling.report(" ".join(sys.argv[1:]))
 
 
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        import multiprocessing
+
+        multiprocessing.freeze_support()
     main()
@@ -21,37 +21,78 @@ from datetime import datetime as dt
 from ratings import update_ratings
 from trueskill import Rating
 
+# The classes use __slots__ and plain floats: a large league loads millions
+# of these, and per-instance dicts and Rating objects would dominate memory.
+
 
 class Player:
+    __slots__ = ("id", "name", "mu", "sigma")
+
     def __init__(self, id, name, mu, sigma):
         self.id = id
         self.name = name
-        self.trueskill = Rating(mu, sigma)
+        self.mu = mu
+        self.sigma = sigma
 
     @property
-    def mu(self):
-        return self.trueskill.mu
+    def trueskill(self):
+        return Rating(self.mu, self.sigma)
 
-    @property
-    def sigma(self):
-        return self.trueskill.sigma
+    @trueskill.setter
+    def trueskill(self, rating):
+        self.mu = rating.mu
+        self.sigma = rating.sigma
 
 
 class Team:
+    __slots__ = ("id", "players")
+
     def __init__(self, id, players=None):
         self.id = id
         self.players = players or []
 
 
+class MatchTeam:
+    """A team's finishing place (1 is first) and optional score in a match."""
+
+    __slots__ = ("team", "place", "score")
+
+    def __init__(self, team, place, score=None):
+        self.team = team
+        self.place = place
+        self.score = score
+
+
 class Match:
+    __slots__ = ("id", "match_teams", "_datetime", "_timestamp")
+
     def __init__(self, id, match_teams=None, datetime=None):
         self.id = id
         self.datetime = datetime or dt.now().isoformat(timespec="minutes")
         self.match_teams = match_teams or []
 
+    @property
+    def datetime(self):
+        """The ISO datetime string, as stored."""
+        return self._datetime
+
+    @datetime.setter
+    def datetime(self, value):
+        self._datetime = value
+        self._timestamp = None
+
+    @property
+    def timestamp(self):
+        """The datetime parsed on first use, for ordering matches."""
+        if self._timestamp is None:
+            self._timestamp = dt.fromisoformat(self._datetime)
+        return self._timestamp
+
+    @property
+    def date(self):
+        return self._datetime.split("T")[0]
+
     def apply_results(self):
-        teams = [entry["team"].players for entry in self.match_teams]
-        ranks = (
-            [entry["place"] for entry in self.match_teams] if len(teams) > 2 else None
-        )
+        teams = [entry.team.players for entry in self.match_teams]
+        ranks = [entry.place for entry in self.match_teams] if len(teams) > 2 else None
         update_ratings(*teams) if ranks is None else update_ratings(*teams, ranks=ranks)
@@ -0,0 +1,173 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+# Kept free of heavy imports: storage and replay code import this module.
+
+import functools
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+MODES = ("text", "json")
+# Set TRUESKILL_PROFILE=text|json to profile without the flags (daemons,
+# cron), and TRUESKILL_PROFILE_DUMP=FILE for a cProfile dump
+ENV_MODE = "TRUESKILL_PROFILE"
+ENV_DUMP = "TRUESKILL_PROFILE_DUMP"
+
+# None when profiling is off; every hook checks this first
+MODE = None
+DUMP_PATH = None
+
+# Span path ("save_db/backup") -> [calls, seconds]
+spans = {}
+counters = {}
+_stack = []
+_started = None
+_profiler = None
+
+
+def configure(mode=None, dump_path=None):
+    """Turns profiling on from the arguments, falling back to the environment."""
+    global MODE, DUMP_PATH
+    env_mode = os.environ.get(ENV_MODE)
+    if mode is None and env_mode:
+        # Any other value (1, yes, ...) means the text summary
+        mode = env_mode if env_mode in MODES else "text"
+    dump_path = dump_path or os.environ.get(ENV_DUMP) or None
+    if mode is None and dump_path is not None:
+        mode = "text"
+    MODE = mode
+    DUMP_PATH = dump_path
+    reset()
+
+
+def reset():
+    """Clears the recorded spans and counters and restarts the clock."""
+    global _started, _profiler
+    spans.clear()
+    counters.clear()
+    _stack.clear()
+    _started = time.perf_counter()
+    if DUMP_PATH is not None:
+        import cProfile
+
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+@contextmanager
+def span(name):
+    """Times the enclosed block, nested under any span already open."""
+    if MODE is None:
+        yield
+        return
+    _stack.append(name)
+    # Added on entry so the report lists spans in the order they started
+    entry = spans.setdefault("/".join(_stack), [0, 0.0])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry[0] += 1
+        entry[1] += time.perf_counter() - start
+        # The daemon resets between requests while its own span is open
+        if _stack:
+            _stack.pop()
+
+
+def timed(name):
+    """Decorates a function to run inside span(name)."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if MODE is None:
+                return function(*args, **kwargs)
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name, n=1):
+    if MODE is not None:
+        counters[name] = counters.get(name, 0) + n
+
+
+class _CountingCursor(sqlite3.Cursor):
+    # One call is one statement, however many rows an executemany binds
+    def execute(self, *args):
+        count("sql_statements")
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        count("sql_statements")
+        return super().executemany(*args)
+
+    def executescript(self, *args):
+        count("sql_statements")
+        return super().executescript(*args)
+
+
+class _CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=_CountingCursor):
+        return super().cursor(factory)
+
+    # The connection shortcuts do not go through cursor()
+    def execute(self, *args):
+        count("sql_statements")
+        return super().execute(*args)
+
+    def executemany(self, *args):
+        count("sql_statements")
+        return super().executemany(*args)
+
+    def executescript(self, *args):
+        count("sql_statements")
+        return super().executescript(*args)
+
+
+def connection_class():
+    """The sqlite3 factory to connect with, counting statements when profiling."""
+    return _CountingConnection if MODE is not None else sqlite3.Connection
+
+
+def report(label=None, file=None):
+    """Writes the summary (or one JSON line) to stderr and the cProfile dump."""
+    if MODE is None:
+        return
+    file = file or sys.stderr
+    total = time.perf_counter() - _started
+    if _profiler is not None:
+        _profiler.disable()
+        _profiler.dump_stats(DUMP_PATH)
+
+    if MODE == "json":
+        record = {
+            "command": label,
+            "total_s": round(total, 6),
+            "spans": {
+                path: {"calls": calls, "s": round(seconds, 6)}
+                for path, (calls, seconds) in spans.items()
+            },
+            "counters": counters,
+        }
+        print(json.dumps(record), file=file)
+        return
+
+    print(f"Profile: {label or ''} ({total * 1000:.1f} ms)", file=file)
+    names = {path: "  " * path.count("/") + path.rsplit("/", 1)[-1] for path in spans}
+    width = max(map(len, [*names.values(), *counters]), default=0)
+    for path, (calls, seconds) in spans.items():
+        print(
+            f"  {names[path].ljust(width)}  {seconds * 1000:9.1f} ms  x{calls}",
+            file=file,
+        )
+    for name in sorted(counters):
+        print(f"  {name.ljust(width)}  {counters[name]:9}", file=file)
+    if _profiler is not None:
+        print(f"  cProfile stats written to {DUMP_PATH}", file=file)
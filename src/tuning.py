@@ -0,0 +1,214 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+"""Scores candidate TrueSkill environments by replaying the match history.
+
+Each candidate replays every match in order, starting everyone from its own
+default rating. Before a two-team match is rated, the candidate's prediction
+for it is scored: the log-loss of the probability it gave the winner, and
+whether a win was its most likely outcome. Matches are rated as
+Match.apply_results rates them, so the first team listed is the winner.
+
+Candidates are replayed together as rows of NumPy arrays, one wave of
+independent matches at a time (see columnar.MatchColumns), and groups of
+candidates run on a process pool. Free-for-alls and matches that list a
+player twice go through trueskill's factor graph one candidate at a time,
+and are not scored. This module needs NumPy; see columnar.available().
+"""
+
+import math
+import os
+
+from itertools import product
+
+import numpy as np
+from trueskill import TrueSkill
+
+import columnar
+import ratings
+import simulation
+
+# Candidates replayed together per task. Fewer tasks cost less per wave, but
+# the arrays grow with candidates times the matches in a wave.
+CONFIGS_PER_TASK = 64
+# Probabilities are clipped here, so one confident miss costs at most ~37
+MIN_PROBABILITY = 1e-16
+
+
+def grid(values):
+    """Every combination of candidate values, as parameter dicts.
+
+    values maps each name in ratings.PARAMETERS to a list of values.
+    """
+    names = ratings.PARAMETERS
+    return [
+        dict(zip(names, combination))
+        for combination in product(*(values[name] for name in names))
+    ]
+
+
+def _plan(matches_sorted):
+    """Lays out the replay as waves of index arrays shared by every candidate.
+
+    Returns (players, sizes, waves, scored). Each wave is (pairs, others):
+    pairs holds, for the two-team matches rated as arrays, a (size, mask,
+    player) triple per team and each match's index into sizes, the distinct
+    player counts; others lists the remaining matches as (teams, ranks).
+    """
+    index = {}
+    for match in matches_sorted:
+        for mt in match.match_teams:
+            for p in mt.team.players:
+                index.setdefault(p.id, len(index))
+    columns = columnar.MatchColumns(matches_sorted, index)
+    match_offsets = columns.match_offsets
+    team_offsets = columns.team_offsets
+    slot_players = columns.slot_players
+    vectorized = columns.vectorized
+
+    waves = []
+    totals = []
+    for wave in columns.schedule():
+        pairs = wave[vectorized[wave]]
+        sides = None
+        if len(pairs):
+            first = match_offsets[pairs]
+            sides = []
+            for team in (first, first + 1):
+                start = team_offsets[team]
+                size = team_offsets[team + 1] - start
+                width = np.arange(size.max())
+                mask = width < size[:, None]
+                player = slot_players[np.where(mask, start[:, None] + width, 0)]
+                sides.append((size, mask, player))
+            totals.append(sides[0][0] + sides[1][0])
+
+        others = []
+        for m in wave[~vectorized[wave]].tolist():
+            teams = [
+                slot_players[team_offsets[t] : team_offsets[t + 1]].tolist()
+                for t in range(match_offsets[m], match_offsets[m + 1])
+            ]
+            # A match the rating backends cannot rate leaves the ratings as
+            # they were
+            if len(teams) < 2 or not all(teams):
+                continue
+            if len(teams) > 2:
+                ranks = columns.places[match_offsets[m] : match_offsets[m + 1]]
+                ranks = ranks.tolist()
+            else:
+                ranks = [0, 1]
+            others.append((teams, ranks))
+        waves.append((sides, others))
+
+    sizes = np.unique(np.concatenate(totals)) if totals else np.zeros(0, np.int64)
+    planned = []
+    remaining = iter(totals)
+    for sides, others in waves:
+        if sides is not None:
+            sides = (sides, np.searchsorted(sizes, next(remaining)))
+        planned.append((sides, others))
+    return len(index), sizes, planned, int(np.count_nonzero(vectorized))
+
+
+def _replay(payload):
+    """Process pool worker: replays the history under a group of candidates.
+
+    Returns the summed log-loss and the number of correct predictions (a
+    tie between win and loss counts half), with one entry per candidate.
+    """
+    count, sizes, waves, candidates = payload
+    names = ratings.PARAMETERS
+    values = np.array([[c[name] for name in names] for c in candidates]).T
+    mu0, sigma0, beta, tau, draw_probability = values
+    mu = np.repeat(mu0[:, None], count, axis=1)
+    sigma = np.repeat(sigma0[:, None], count, axis=1)
+    beta2 = (beta * beta)[:, None]
+    tau2 = (tau * tau)[:, None, None]
+    margins = np.array(
+        [
+            [ratings.draw_margin(n, p, b) for n in sizes.tolist()]
+            for b, p in zip(beta.tolist(), draw_probability.tolist())
+        ]
+    ).reshape(len(candidates), len(sizes))
+    envs = None
+
+    log_loss = np.zeros(len(candidates))
+    correct = np.zeros(len(candidates))
+    for pairs, others in waves:
+        if pairs is not None:
+            sides, size_index = pairs
+            teams = []
+            for _, mask, player in sides:
+                team_sigma = sigma[:, player]
+                team_mu = np.where(mask, mu[:, player], 0.0)
+                var = np.where(mask, team_sigma * team_sigma + tau2, 0.0)
+                teams.append((team_mu, var))
+            (w_mu, w_var), (l_mu, l_var) = teams
+            total = sides[0][0] + sides[1][0]
+
+            c2 = w_var.sum(axis=2) + l_var.sum(axis=2) + total * beta2
+            c = np.sqrt(c2)
+            t = (w_mu.sum(axis=2) - l_mu.sum(axis=2)) / c
+            eps = margins[:, size_index] / c
+
+            # Scored before the result is applied
+            win = simulation.cdf(t - eps)
+            loss = simulation.cdf(-t - eps)
+            log_loss -= np.log(np.maximum(win, MIN_PROBABILITY)).sum(axis=1)
+            hit = np.where(win >= 1 - win - loss, (np.sign(win - loss) + 1) / 2, 0.0)
+            correct += hit.sum(axis=1)
+
+            v, w = simulation.v_w_win(t, eps)
+            v, w = v[:, :, None], w[:, :, None]
+            c, c2 = c[:, :, None], c2[:, :, None]
+            for sign, (_, mask, player), (team_mu, var) in zip((1, -1), sides, teams):
+                new_mu = team_mu + sign * var / c * v
+                new_sigma = np.sqrt(var * (1 - var / c2 * w))
+                player = player[mask]
+                mu[:, player] = new_mu[:, mask]
+                sigma[:, player] = new_sigma[:, mask]
+
+        if others and envs is None:
+            envs = [TrueSkill(**candidate) for candidate in candidates]
+        for teams, ranks in others:
+            for i, env in enumerate(envs):
+                groups = [
+                    [env.create_rating(mu[i, p], sigma[i, p]) for p in team]
+                    for team in teams
+                ]
+                for team, rated in zip(teams, env.rate(groups, ranks)):
+                    for p, rating in zip(team, rated):
+                        mu[i, p], sigma[i, p] = rating.mu, rating.sigma
+    return log_loss, correct
+
+
+def tune(matches, candidates, workers=None):
+    """Replays the matches under each candidate environment.
+
+    candidates are parameter dicts, as grid() makes. Returns (scored,
+    scores): how many matches were scored, and per candidate its mean
+    log-loss and accuracy over them.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    matches_sorted = sorted(matches, key=lambda m: m.timestamp)
+    count, sizes, waves, scored = _plan(matches_sorted)
+
+    workers = min(workers or os.cpu_count() or 1, len(candidates))
+    tasks = max(workers, math.ceil(len(candidates) / CONFIGS_PER_TASK))
+    bounds = np.linspace(0, len(candidates), tasks + 1).astype(int).tolist()
+    payloads = [
+        (count, sizes, waves, candidates[start:end])
+        for start, end in zip(bounds, bounds[1:])
+        if end > start
+    ]
+    if workers <= 1:
+        results = list(map(_replay, payloads))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_replay, payloads))
+
+    log_loss = np.concatenate([result[0] for result in results])
+    correct = np.concatenate([result[1] for result in results])
+    if not scored:
+        return 0, [(math.nan, math.nan)] * len(candidates)
+    return scored, list(zip((log_loss / scored).tolist(), (correct / scored).tolist()))
@@ -0,0 +1,36 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+MAIN = os.path.join(ROOT, "src", "main.py")
+# The modules import each other as top-level names, as main.py runs them
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+
+@pytest.fixture
+def league(tmp_path, monkeypatch):
+    """A fresh league.db in a temporary directory, next to schemas.sql."""
+    shutil.copy(os.path.join(ROOT, "schemas.sql"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    return str(tmp_path / "league.db")
+
+
+@pytest.fixture
+def cli(league):
+    """Runs the CLI on the test league and returns its completed process."""
+
+    def run(*argv, stdin=None):
+        return subprocess.run(
+            [sys.executable, MAIN, "--db-path", league, *argv],
+            input=stdin,
+            capture_output=True,
+            text=True,
+        )
+
+    return run
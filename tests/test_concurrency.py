@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+NAMES = [f"P{i}" for i in range(8)]
+WRITERS = 4
+COMMANDS = 6
+
+
+def ratings(db_path):
+    conn = sqlite3.connect(db_path)
+    players = {
+        pid: (mu, sigma)
+        for pid, mu, sigma in conn.execute("SELECT id, mu, sigma FROM players")
+    }
+    days = {
+        (pid, day): (mu, sigma)
+        for pid, day, mu, sigma in conn.execute(
+            "SELECT player_id, date, mu, sigma FROM player_days"
+        )
+    }
+    conn.close()
+    return players, days
+
+
+def assert_close(saved, replayed):
+    assert saved.keys() == replayed.keys()
+    for key in saved:
+        assert saved[key] == pytest.approx(replayed[key], abs=1e-9)
+
+
+def test_concurrent_writers_lose_nothing(cli, league, tmp_path):
+    cli("players", "add", ",".join(NAMES))
+
+    def writer(worker):
+        outputs = []
+        for i in range(COMMANDS):
+            if i % 3 == 2:
+                result = cli("players", "add", f"W{worker}-{i}")
+            else:
+                # Out of order, so most adds replay some history
+                pair = f"{NAMES[(worker + i) % 8]},{NAMES[(worker + i + 3) % 8]}"
+                when = f"2025-05-{10 - i:02}T{10 + worker:02}:00"
+                result = cli("matches", "add", pair, "--time", when)
+            outputs.append(result)
+        return outputs
+
+    with ThreadPoolExecutor(WRITERS) as pool:
+        results = [r for rs in pool.map(writer, range(WRITERS)) for r in rs]
+
+    for result in results:
+        assert result.returncode == 0, result.stdout + result.stderr
+    conn = sqlite3.connect(league)
+    players, matches = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM players), (SELECT COUNT(*) FROM matches)"
+    ).fetchone()
+    conn.close()
+    added_players = WRITERS * (COMMANDS // 3)
+    assert players == len(NAMES) + added_players
+    assert matches == WRITERS * COMMANDS - added_players
+
+    # What the writers saved incrementally must match a full replay
+    replayed = str(tmp_path / "replayed.db")
+    shutil.copy(league, replayed)
+    result = cli("--db-path", replayed, "rebuild-snapshots")
+    assert result.returncode == 0, result.stderr
+    for saved, fresh in zip(ratings(league), ratings(replayed)):
+        assert_close(saved, fresh)
@@ -0,0 +1,58 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from conftest import MAIN
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(socket, "AF_UNIX"), reason="serve needs Unix domain sockets"
+)
+
+BATCH = """\
+players add Alice,Bob,Carol
+matches add Alice,Bob --time 2025-05-01T15:00
+matches add Carol,Nobody --time 2025-05-01T16:00
+"""
+
+
+@pytest.fixture
+def daemon(cli, league):
+    """A running `serve` on the test league."""
+    cli("players", "list")
+    process = subprocess.Popen(
+        [sys.executable, MAIN, "--db-path", league, "serve"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while not os.path.exists(f"{league}.sock"):
+        assert time.monotonic() < deadline, "serve did not open its socket"
+        time.sleep(0.05)
+    yield process
+    process.terminate()
+    process.wait()
+
+
+def test_failed_batch_leaves_nothing_behind(daemon, cli, league, tmp_path):
+    batch = tmp_path / "results.txt"
+    batch.write_text(BATCH, encoding="utf-8")
+
+    result = cli("batch", str(batch))
+    assert "nothing was saved" in result.stdout
+    # The daemon must not carry the failed batch's players into this save
+    result = cli("players", "add", "Zed")
+    assert "Player 'Zed' added." in result.stdout
+
+    conn = sqlite3.connect(league)
+    players = [row[0] for row in conn.execute("SELECT name FROM players")]
+    matches = conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+    conn.close()
+    assert players == ["Zed"]
+    assert matches == 0
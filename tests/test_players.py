@@ -0,0 +1,38 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sqlite3
+
+
+def test_delete_refused_for_player_with_matches(cli, league):
+    cli("players", "add", "Alice,Bob,Carol")
+    cli("matches", "add", "Alice,Bob", "--time", "2025-05-02T10:00")
+
+    result = cli("players", "delete", "Alice")
+    assert "delete their matches first" in result.stdout
+
+    # The league can still be replayed from before the existing match
+    result = cli("matches", "add", "Bob,Carol", "--time", "2025-05-01T10:00")
+    assert "Match recorded" in result.stdout
+    conn = sqlite3.connect(league)
+    names = {row[0] for row in conn.execute("SELECT name FROM players")}
+    matches = conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+    conn.close()
+    assert names == {"Alice", "Bob", "Carol"}
+    assert matches == 2
+
+
+def test_delete_then_add_earlier_match(cli, league):
+    cli("players", "add", "Alice,Bob,Carol")
+    cli("matches", "add", "Alice,Bob", "--time", "2025-05-02T10:00")
+    cli("matches", "delete", "1")
+
+    result = cli("players", "delete", "Alice")
+    assert "Deleted player" in result.stdout
+    result = cli("matches", "add", "Bob,Carol", "--time", "2025-05-01T10:00")
+    assert "Match recorded" in result.stdout
+    result = cli("rebuild-snapshots")
+    assert result.returncode == 0, result.stderr
+    conn = sqlite3.connect(league)
+    names = {row[0] for row in conn.execute("SELECT name FROM players")}
+    conn.close()
+    assert names == {"Bob", "Carol"}
@@ -0,0 +1,16 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import sqlite3
+
+import profiling
+
+
+def test_executemany_counts_as_one_statement(monkeypatch):
+    monkeypatch.setattr(profiling, "MODE", "text")
+    monkeypatch.setattr(profiling, "counters", {})
+    conn = sqlite3.connect(":memory:", factory=profiling.connection_class())
+    conn.execute("CREATE TABLE t (x)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(50)])
+    conn.cursor().executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(50)])
+
+    assert profiling.counters["sql_statements"] == 3
@@ -0,0 +1,23 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+
+def test_player_lookup_ignores_case(cli):
+    cli("players", "add", "Alice,Bob,Straße")
+    cli("matches", "add", "Alice,Bob", "--time", "2025-05-01T10:00")
+
+    result = cli("players", "history", "ALICE")
+    assert "Rating history for Alice:" in result.stdout
+    assert "Did you mean" not in result.stdout
+    # Equal only once folded beyond ASCII
+    result = cli("rankings", "--player", "STRASSE")
+    assert "Straße is ranked" in result.stdout
+    assert "Did you mean" not in result.stdout
+
+
+def test_player_lookup_falls_back_to_fuzzy_match(cli):
+    cli("players", "add", "Alice,Bob")
+    cli("matches", "add", "Alice,Bob", "--time", "2025-05-01T10:00")
+
+    result = cli("players", "history", "Alise")
+    assert "Did you mean 'Alice'?" in result.stdout
+    assert "Rating history for Alice:" in result.stdout
@@ -0,0 +1,37 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+
+import os
+import sqlite3
+
+
+def test_save_deletes_rows_pointing_at_deleted_rows(cli, league):
+    cli("players", "add", "Alice,Bob")
+    cli("matches", "add", "Alice,Bob", "--time", "2025-05-01T10:00")
+    conn = sqlite3.connect(league)
+    # Left behind by an older version that deleted without cleaning up
+    conn.execute("INSERT INTO team_players (team_id, player_id) VALUES (1, 99)")
+    conn.execute("INSERT INTO match_teams (match_id, team_id, place) VALUES (99, 1, 1)")
+    conn.commit()
+
+    cli("players", "add", "Carol")
+
+    orphans = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM team_players WHERE player_id = 99)"
+        " + (SELECT COUNT(*) FROM match_teams WHERE match_id = 99)"
+    ).fetchone()[0]
+    conn.close()
+    assert orphans == 0
+
+
+def test_backup_only_when_due(cli, league):
+    cli("players", "add", "Alice")
+    assert os.path.exists("league_backup.db")
+    os.utime("league_backup.db", (0, 0))
+    cli("players", "add", "Bob")
+    assert os.path.getmtime("league_backup.db") > 0
+
+    cli("players", "add", "Carol")
+    mtime = os.path.getmtime("league_backup.db")
+    os.utime("league_backup.db", (mtime - 60, mtime - 60))
+    cli("players", "add", "Dave")
+    assert os.path.getmtime("league_backup.db") == mtime - 60